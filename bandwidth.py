@@ -0,0 +1,241 @@
+import contextlib
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+
+from metrics import WAIT, stage
+
+INITIAL_PER_HOST = 2
+MAX_PER_HOST = 8
+ADJUST_INTERVAL = 2.0
+CHANGE_THRESHOLD = 0.1
+DECREASE_FACTOR = 0.5
+PROBE_EPOCHS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+MAX_THROTTLE_RETRIES = 5
+THROTTLE_STATUSES = (429, 503)
+WAIT_POLL = 0.5
+
+
+def host_key(url):
+    # Media CDNs spread one site over many numbered edge hosts, so limits are
+    # kept per registrable domain rather than per hostname.
+    host = (urllib.parse.urlparse(url).hostname or '').lower()
+    labels = host.split('.')
+    if len(labels) <= 2 or host.replace('.', '').isdigit():
+        return host
+    return '.'.join(labels[-2:])
+
+
+def retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rate(value):
+    # "0" or "" means unlimited; "1.5M" and "800k" are bytes per second.
+    if value is None:
+        return None
+    value = str(value).strip().lower().rstrip('b/s')
+    if not value:
+        return None
+    scale = 1
+    if value[-1] in 'kmg':
+        scale = 1000 ** ('kmg'.index(value[-1]) + 1)
+        value = value[:-1]
+    rate = float(value) * scale
+    return rate if rate > 0 else None
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        # Tokens are taken up front and any deficit is slept off afterwards,
+        # so a chunk larger than the bucket still goes through at the cap.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            deficit = -self._tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+
+class HostLimiter:
+    # AIMD controller for the number of concurrent downloads from one host.
+    # While every allowed slot is busy, each interval's aggregate throughput
+    # is compared with the best seen so far: a clear gain adds a slot, a clear
+    # loss (the server slowing everyone down) halves the limit, and a plateau
+    # holds it, probing one extra slot every few intervals. HTTP 429/503
+    # halves the limit too and blocks new downloads until the backoff ends.
+    def __init__(self, host, initial=INITIAL_PER_HOST, maximum=MAX_PER_HOST, bucket=None):
+        self.host = host
+        self.maximum = maximum
+        self.limit = float(min(initial, maximum))
+        self.active = 0
+        self.bucket = bucket
+        self.throughput = 0.0
+        self.backoff_until = 0.0
+        self._best = 0.0
+        self._failures = 0
+        self._plateaus = 0
+        self._probing = False
+        self._epoch_started = time.monotonic()
+        self._epoch_bytes = 0
+        self._saturated = True
+        self._condition = threading.Condition()
+
+    def acquire(self, job=None):
+        with self._condition:
+            while True:
+                if job is not None:
+                    job.check_cancelled()
+                backoff = self.backoff_until - time.monotonic()
+                if backoff <= 0 and self.active < int(self.limit):
+                    self.active += 1
+                    return
+                self._condition.wait(min(backoff, WAIT_POLL) if backoff > 0 else WAIT_POLL)
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def transferred(self, amount):
+        with self._condition:
+            self._epoch_bytes += amount
+            if self.active < int(self.limit):
+                self._saturated = False
+            now = time.monotonic()
+            elapsed = now - self._epoch_started
+            if elapsed >= ADJUST_INTERVAL:
+                self.throughput = self._epoch_bytes / elapsed
+                if self._saturated:
+                    self._adjust()
+                self._epoch_started = now
+                self._epoch_bytes = 0
+                self._saturated = self.active >= int(self.limit)
+                self._condition.notify_all()
+        if self.bucket is not None:
+            self.bucket.consume(amount)
+
+    def _adjust(self):
+        if self.throughput > self._best * (1 + CHANGE_THRESHOLD):
+            self._best = self.throughput
+            self.limit = min(self.maximum, self.limit + 1)
+            self._probing = False
+        elif self.throughput < self._best * (1 - CHANGE_THRESHOLD):
+            self._best = self.throughput
+            self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+            self._probing = False
+        elif self._probing:
+            self.limit = max(1.0, self.limit - 1)
+            self._probing = False
+        else:
+            self._plateaus += 1
+            if self._plateaus >= PROBE_EPOCHS and self.limit < self.maximum:
+                self.limit += 1
+                self._plateaus = 0
+                self._probing = True
+
+    def throttled(self, retry_after=None):
+        # Concurrent requests rejected in the same burst only cut the limit
+        # once; the backoff doubles with every consecutive rejection.
+        with self._condition:
+            now = time.monotonic()
+            if now >= self.backoff_until:
+                self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+                self._best = 0.0
+                self._failures += 1
+            delay = retry_after
+            if delay is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self._failures - 1)) * random.uniform(0.5, 1.0)
+            self.backoff_until = max(self.backoff_until, now + delay)
+            return self.backoff_until - now
+
+    def recovered(self):
+        with self._condition:
+            self._failures = 0
+
+    def stats(self):
+        with self._condition:
+            return {
+                'limit': int(self.limit),
+                'active': self.active,
+                'throughput': round(self.throughput),
+                'per_connection': round(self.throughput / self.active) if self.active else None,
+                'backoff': round(max(0.0, self.backoff_until - time.monotonic()), 1),
+            }
+
+
+class BandwidthController:
+    def __init__(self, max_per_host=MAX_PER_HOST, initial_per_host=INITIAL_PER_HOST, bandwidth_cap=None):
+        self.max_per_host = max_per_host
+        self.initial_per_host = initial_per_host
+        self.bucket = TokenBucket(bandwidth_cap) if bandwidth_cap else None
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_per_host=None, bandwidth_cap=None):
+        with self._lock:
+            if max_per_host:
+                self.max_per_host = max_per_host
+            self.bucket = TokenBucket(bandwidth_cap) if bandwidth_cap else None
+            for limiter in self._hosts.values():
+                limiter.maximum = self.max_per_host
+                limiter.limit = min(limiter.limit, self.max_per_host)
+                limiter.bucket = self.bucket
+
+    def host(self, url):
+        key = host_key(url)
+        with self._lock:
+            if key not in self._hosts:
+                self._hosts[key] = HostLimiter(key, self.initial_per_host, self.max_per_host, self.bucket)
+            return self._hosts[key]
+
+    @contextlib.contextmanager
+    def slot(self, url, job=None, metrics=None):
+        limiter = self.host(url)
+        with stage(metrics, WAIT):
+            limiter.acquire(job)
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._hosts.values())
+        return {limiter.host: limiter.stats() for limiter in limiters}
+
+
+def host_slot(bandwidth, url, job=None, metrics=None):
+    if bandwidth is None:
+        return contextlib.nullcontext()
+    return bandwidth.slot(url, job, metrics)
+
+
+def backoff_delay(error, limiter, attempts):
+    # Re-raises anything that is not a throttling response, or once the
+    # retries are used up; otherwise returns how long the host is backed off.
+    if limiter is None or error.code not in THROTTLE_STATUSES or attempts >= MAX_THROTTLE_RETRIES:
+        raise error
+    return limiter.throttled(retry_after_seconds(error.headers.get('Retry-After')))
@@ -0,0 +1,525 @@
+import argparse
+import contextlib
+import functools
+import http.server
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bandwidth import parse_rate
+
+FORMATS = ('aac', 'mp3', 'flac', 'wav')
+CONVERSION_METHODS = ('ffmpeg', 'pydub', 'chunked')
+CONCURRENCY = (1, 2, 4)
+DURATIONS = (10, 60, 300)
+
+# Fixtures are AAC at 44.1 kHz, so lossy targets at 48 kHz are always
+# re-encoded rather than stream-copied and the numbers measure real encodes.
+FIXTURE_CODEC = 'aac'
+FIXTURE_BITRATE = 128000
+FIXTURE_SAMPLE_RATE = 44100
+
+# The segment check encodes pink noise, which never repeats, so any shift
+# between the segmented and the single-process encode shows up as a lag
+# instead of lining up a period later. Every 100 ms window of the segmented
+# output must match the single-process one this well. The track is split
+# into a fixed number of segments, so there are seams to check whatever the
+# core count.
+SEGMENT_CHECK_DURATION = 4 * 60
+SEGMENT_CHECK_SEGMENTS = 4
+SEGMENT_CHECK_WINDOW = 0.1
+SEGMENT_CHECK_MIN_SNR = 20.0
+
+# Rate-limited fixture servers answer surplus connections with this
+# Retry-After, and pace each response body in this many steps per second.
+RETRY_AFTER = 1
+PACE_STEPS = 10
+
+
+def split_list(value, convert=str):
+    return [convert(item.strip()) for item in value.split(',') if item.strip()]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def generate_fixtures(directory, durations, ffmpeg_path):
+    import ffmpeg
+
+    fixtures = []
+    for duration in durations:
+        name = f"fixture-{duration}s.m4a"
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            (
+                ffmpeg
+                .input(f"sine=frequency=440:sample_rate={FIXTURE_SAMPLE_RATE}:duration={duration}", f='lavfi')
+                .output(path, acodec=FIXTURE_CODEC, audio_bitrate=FIXTURE_BITRATE, ac=2)
+                .global_args('-loglevel', 'error')
+                .overwrite_output()
+                .run(cmd=ffmpeg_path)
+            )
+        fixtures.append({'name': name, 'duration': duration, 'size': os.path.getsize(path)})
+    return fixtures
+
+
+class FixtureHandler(http.server.SimpleHTTPRequestHandler):
+    # Adds single-range support on top of SimpleHTTPRequestHandler so resumed
+    # downloads can be exercised against the fixture server too. It can also
+    # simulate a throttling host: connection_rate paces every response body,
+    # and requests beyond the connections semaphore are refused with 429.
+    connection_rate = None
+    connections = None
+
+    def do_GET(self):
+        if self.connections is not None and not self.connections.acquire(blocking=False):
+            self.send_response(429)
+            self.send_header('Retry-After', str(RETRY_AFTER))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        try:
+            super().do_GET()
+        finally:
+            if self.connections is not None:
+                self.connections.release()
+
+    def copyfile(self, source, outputfile):
+        if not self.connection_rate:
+            return super().copyfile(source, outputfile)
+        chunk_size = max(1, int(self.connection_rate / PACE_STEPS))
+        started = time.perf_counter()
+        sent = 0
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            sent += len(chunk)
+            delay = sent / self.connection_rate - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def send_head(self):
+        match = re.match(r'^bytes=(\d+)-$', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        fixture_file = open(path, 'rb')
+        fixture_file.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f"bytes {start}-{size - 1}/{size}")
+        self.send_header('Content-Length', str(size - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return fixture_file
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_fixtures(directory, connection_rate=None, max_connections=None):
+    limited = type('FixtureHandler', (FixtureHandler,), {
+        'connection_rate': connection_rate,
+        'connections': threading.BoundedSemaphore(max_connections) if max_connections else None,
+    })
+    handler = functools.partial(limited, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def decode_mono(path, sample_rate, ffmpeg_path):
+    import ffmpeg
+    import numpy as np
+
+    pcm, _ = (
+        ffmpeg
+        .input(path)
+        .output('pipe:1', f='f32le', acodec='pcm_f32le', ac=1, ar=sample_rate)
+        .global_args('-loglevel', 'error')
+        .run(cmd=ffmpeg_path, capture_stdout=True)
+    )
+    return np.frombuffer(pcm, dtype=np.float32)
+
+
+def check_segmented(work_dir, formats, ffmpeg_path):
+    # Encodes the noise through segmented_transcode and through the plain
+    # single-process path and compares the decoded results as they are: a
+    # player hears both from their first sample, so they must start at the
+    # same sample, have the same length and match in every window.
+    import ffmpeg
+    import numpy as np
+    from segmented import SEGMENT_FORMATS, plan_segments, segmented_transcode
+    from transcoder import OutputTarget, build_outputs
+
+    os.makedirs(work_dir, exist_ok=True)
+    source = os.path.join(work_dir, 'noise.m4a')
+    (
+        ffmpeg
+        .input(f"anoisesrc=color=pink:amplitude=0.3:sample_rate={FIXTURE_SAMPLE_RATE}:duration={SEGMENT_CHECK_DURATION}", f='lavfi')
+        .output(source, acodec=FIXTURE_CODEC, audio_bitrate=FIXTURE_BITRATE, ac=2)
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+        .run(cmd=ffmpeg_path)
+    )
+
+    checks = []
+    for format in formats:
+        target = OutputTarget(format)
+        sample_rate = int(target.sampling_rate)
+        frame_size, delay = SEGMENT_FORMATS[format][:2]
+        check = {'format': format, 'passed': False}
+        checks.append(check)
+        try:
+            single_dir = os.path.join(work_dir, f"single-{format}")
+            output_dir = os.path.join(work_dir, f"segmented-{format}")
+            os.makedirs(single_dir, exist_ok=True)
+            os.makedirs(output_dir, exist_ok=True)
+            graph, single = build_outputs(ffmpeg.input(source), single_dir, 'noise', [target])
+            graph.run(cmd=ffmpeg_path)
+            result = segmented_transcode(source, output_dir, [target], ffmpeg_path, threshold=0, max_workers=SEGMENT_CHECK_SEGMENTS,
+                                         stream_copy=False, remove_source=False)
+            expected = decode_mono(single[0].path, sample_rate, ffmpeg_path)
+            actual = decode_mono(result.outputs[0].path, sample_rate, ffmpeg_path)
+        except Exception as e:
+            check['error'] = str(e)
+            continue
+
+        # Lag of the segmented output against the single-process one,
+        # searched on either side of zero.
+        window = int(sample_rate * SEGMENT_CHECK_WINDOW)
+        max_lag = delay + 2 * frame_size
+        correlation = np.correlate(actual[:sample_rate + 2 * max_lag], expected[max_lag:sample_rate + max_lag], 'valid')
+        lag = int(np.argmax(correlation)) - max_lag
+        length_difference = len(actual) - len(expected)
+
+        count = min(len(actual), len(expected)) // window * window
+        signal = np.square(expected[:count]).reshape(-1, window).sum(axis=1)
+        error = np.square(actual[:count] - expected[:count]).reshape(-1, window).sum(axis=1)
+        with np.errstate(divide='ignore'):
+            snr = 10 * np.log10(signal / np.maximum(error, 1e-20))
+        check.update({
+            'segments': len(plan_segments(len(expected), sample_rate, format, SEGMENT_CHECK_SEGMENTS)),
+            'lag': lag,
+            'length_difference': length_difference,
+            'min_snr_db': round(float(snr.min()), 2) if snr.size else None,
+            'worst_window_seconds': round(float(np.argmin(snr)) * SEGMENT_CHECK_WINDOW, 1) if snr.size else None,
+            'passed': bool(snr.size) and lag == 0 and length_difference == 0 and float(snr.min()) >= SEGMENT_CHECK_MIN_SNR,
+        })
+    return checks
+
+
+def fixture_fetcher(fixtures, base_url):
+    from metadata import video_id
+
+    # Stands in for extractors.fetch_metadata: every benchmark URL resolves to
+    # one of the local fixtures, with the same metadata shape the real
+    # extractors return, so the cache, downloader and transcoder run unchanged.
+    def fetch(youtube_url, library_source='pytube', sessions=None):
+        key = video_id(youtube_url)
+        index = int(key[len('bench'):])
+        fixture = fixtures[index % len(fixtures)]
+        return {
+            'title': f"Benchmark {index}",
+            'author': 'benchmark',
+            'duration': fixture['duration'],
+            'source': {
+                'url': base_url + fixture['name'],
+                'headers': {},
+                'name': f"bench-{index:06d}",
+                'ext': 'm4a',
+                'codec': FIXTURE_CODEC,
+                'sample_rate': FIXTURE_SAMPLE_RATE,
+                'bitrate': FIXTURE_BITRATE,
+            },
+            'video_id': key,
+            'library_source': library_source,
+        }
+    return fetch
+
+
+def usage():
+    if resource is None:
+        return None, None
+    # getrusage reports the peak RSS of the largest single process among the
+    # interpreter and its waited-for descendants, not of the whole tree, so
+    # it is reported as a per-process maximum; CPU time is the tree's total.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    max_process_rss = max(own.ru_maxrss, children.ru_maxrss) * scale
+    cpu_seconds = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return max_process_rss, cpu_seconds
+
+
+def run_config(config):
+    # Runs in its own interpreter so RSS and CPU time belong to exactly
+    # one configuration, including its transcode workers and ffmpeg children.
+    import converter
+    import extractors
+    from metadata import MetadataCache
+
+    converter.FFMPEG_PATH = config['ffmpeg']
+    converter.configure_bandwidth(config['concurrency'], config.get('max_bandwidth'))
+    converter.metadata_cache = MetadataCache(os.path.join(config['work_dir'], 'metadata.sqlite3'))
+    extractors.fetch_metadata = fixture_fetcher(config['fixtures'], config['base_url'])
+
+    submitted = {}
+    finished = {}
+    lock = threading.Lock()
+
+    def on_state_change(job):
+        if job.state in ('done', 'failed', 'cancelled'):
+            with lock:
+                finished[job.id] = (time.perf_counter(), job.state, str(job.error) if job.error else None)
+
+    scheduler = converter.create_scheduler(
+        config['concurrency'],
+        config['concurrency'],
+        on_state_change,
+        os.path.join(config['work_dir'], 'metrics.jsonl')
+    )
+    jobs = [converter.build_job(
+        f"https://www.youtube.com/watch?v=bench{index:06d}",
+        output_dir=config['output_dir'],
+        format=config['format'],
+        conversion_method=config['conversion_method'],
+        library_source='yt_dlp'
+    ) for index in range(config['jobs'])]
+
+    started = time.perf_counter()
+    try:
+        for job in jobs:
+            submitted[job.id] = time.perf_counter()
+            scheduler.submit(job)
+        scheduler.join()
+    finally:
+        scheduler.shutdown()
+        converter.get_transcode_engine().shutdown()
+        converter.get_metadata_cache().close()
+    wall_seconds = time.perf_counter() - started
+    max_process_rss, cpu_seconds = usage()
+
+    latencies = [finished[job.id][0] - submitted[job.id] for job in jobs if job.id in finished]
+    failures = [finished[job.id][2] for job in jobs if job.id in finished and finished[job.id][1] != 'done']
+    done = [job.metrics for job in jobs if job.metrics is not None and job.metrics.state == 'done']
+    media_seconds = sum(metrics.media_duration or 0 for metrics in done)
+    downloaded = sum(job.metrics.bytes_downloaded for job in jobs if job.metrics is not None)
+    stages = {}
+    for metrics in done:
+        for name, seconds in metrics.stages.items():
+            stages.setdefault(name, []).append(seconds)
+
+    return {
+        'format': config['format'],
+        'conversion_method': config['conversion_method'],
+        'concurrency': config['concurrency'],
+        'jobs': len(jobs),
+        'failed': len(failures),
+        'errors': failures[:5],
+        'wall_seconds': round(wall_seconds, 3),
+        'jobs_per_second': round(len(done) / wall_seconds, 4) if wall_seconds else None,
+        'media_seconds_per_second': round(media_seconds / wall_seconds, 2) if wall_seconds else None,
+        'download_mb_per_second': round(downloaded / wall_seconds / 1e6, 3) if wall_seconds else None,
+        'latency_p50': round(percentile(latencies, 0.50), 3) if latencies else None,
+        'latency_p95': round(percentile(latencies, 0.95), 3) if latencies else None,
+        'max_process_rss_mb': round(max_process_rss / 1e6, 1) if max_process_rss is not None else None,
+        'cpu_seconds': round(cpu_seconds, 3) if cpu_seconds is not None else None,
+        'stages': {name: round(sum(values) / len(values), 4) for name, values in sorted(stages.items())},
+        'hosts': converter.get_bandwidth_controller().stats(),
+    }
+
+
+def spawn_config(config):
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-config', json.dumps(config)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit code {completed.returncode}")
+    return json.loads(lines[-1])
+
+
+def ffmpeg_version(ffmpeg_path):
+    try:
+        completed = subprocess.run([ffmpeg_path, '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return completed.stdout.splitlines()[0] if completed.stdout else None
+
+
+def result_key(result):
+    return result['format'], result['conversion_method'], result['concurrency']
+
+
+def find_regressions(results, baseline, tolerance):
+    previous = {result_key(result): result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        checks = (
+            ('jobs_per_second', lambda old, new: new < old * (1 - tolerance)),
+            ('latency_p95', lambda old, new: new > old * (1 + tolerance)),
+            ('max_process_rss_mb', lambda old, new: new > old * (1 + tolerance)),
+        )
+        for field, regressed in checks:
+            old, new = before.get(field), result.get(field)
+            if old and new is not None and regressed(old, new):
+                regressions.append({
+                    'format': result['format'],
+                    'conversion_method': result['conversion_method'],
+                    'concurrency': result['concurrency'],
+                    'metric': field,
+                    'baseline': old,
+                    'current': new,
+                })
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmark', description="Benchmark conversions offline against locally generated fixture audio. "
+                                                                   "Results are written as JSON.")
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--methods', default=','.join(CONVERSION_METHODS))
+    parser.add_argument('--concurrency', default=','.join(str(level) for level in CONCURRENCY))
+    parser.add_argument('--durations', default=','.join(str(duration) for duration in DURATIONS), help="fixture lengths in seconds")
+    parser.add_argument('--jobs', type=int, default=None, help="jobs per configuration (default: two per fixture)")
+    parser.add_argument('--ffmpeg', default='ffmpeg', help="ffmpeg executable; pydub uses the one on PATH")
+    parser.add_argument('--work-dir', help="where fixtures and outputs are kept (default: a temporary folder)")
+    parser.add_argument('--output', help="write results here instead of stdout")
+    parser.add_argument('--baseline', help="earlier results to compare against; regressions set exit code 1")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed relative change before a regression is reported")
+    parser.add_argument('--max-bandwidth', type=parse_rate, help="download bandwidth cap in bytes/s, e.g. 2M")
+    parser.add_argument('--server-rate', type=parse_rate, help="pace each fixture response to this many bytes/s")
+    parser.add_argument('--server-connections', type=int, help="answer 429 beyond this many concurrent fixture downloads")
+    parser.add_argument('--check-segmented', action='store_true',
+                        help="only verify that segmented MP3/AAC encodes match single-process encodes sample for sample")
+    parser.add_argument('--run-config', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_config:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_config(json.loads(args.run_config))
+        print(json.dumps(result))
+        return 0
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='audiophile-benchmark-')
+    if args.check_segmented:
+        try:
+            checks = check_segmented(work_dir, [format for format in split_list(args.formats) if format in ('aac', 'mp3')], args.ffmpeg)
+        finally:
+            if not args.work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        print(json.dumps({'segmented': checks}, indent=2))
+        return 0 if all(check['passed'] for check in checks) else 1
+
+    fixture_dir = os.path.join(work_dir, 'fixtures')
+    os.makedirs(fixture_dir, exist_ok=True)
+    durations = split_list(args.durations, int)
+    fixtures = generate_fixtures(fixture_dir, durations, args.ffmpeg)
+    jobs = args.jobs or len(fixtures) * 2
+
+    results = []
+    try:
+        with serve_fixtures(fixture_dir, args.server_rate, args.server_connections) as base_url:
+            for format in split_list(args.formats):
+                for conversion_method in split_list(args.methods):
+                    for concurrency in split_list(args.concurrency, int):
+                        name = f"{format}-{conversion_method}-{concurrency}"
+                        config_dir = os.path.join(work_dir, name)
+                        config = {
+                            'format': format,
+                            'conversion_method': conversion_method,
+                            'concurrency': concurrency,
+                            'jobs': jobs,
+                            'fixtures': fixtures,
+                            'base_url': base_url,
+                            'ffmpeg': args.ffmpeg,
+                            'work_dir': config_dir,
+                            'output_dir': os.path.join(config_dir, 'output'),
+                            'max_bandwidth': args.max_bandwidth,
+                        }
+                        os.makedirs(config_dir, exist_ok=True)
+                        print(f"Benchmarking {name}...", file=sys.stderr)
+                        try:
+                            results.append(spawn_config(config))
+                        except Exception as e:
+                            print(f"Benchmark {name} failed: {e}", file=sys.stderr)
+                            results.append({'format': format, 'conversion_method': conversion_method, 'concurrency': concurrency,
+                                            'jobs': jobs, 'failed': jobs, 'errors': [str(e)]})
+                        finally:
+                            shutil.rmtree(os.path.join(config_dir, 'output'), ignore_errors=True)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': ffmpeg_version(args.ffmpeg),
+        },
+        'fixtures': [{'duration': fixture['duration'], 'size': fixture['size']} for fixture in fixtures],
+        'results': results,
+    }
+    exit_code = 1 if any(result['failed'] for result in results) else 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            report['regressions'] = find_regressions(results, json.load(baseline_file), args.tolerance)
+        if report['regressions']:
+            exit_code = 1
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(text + '\n')
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
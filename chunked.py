@@ -0,0 +1,121 @@
+import os
+import threading
+
+import ffmpeg
+import numpy as np
+
+from transcoder import ENCODE, CHUNK_FRAMES, TranscodeOutput, adjust_stream, output_options, probe_audio
+
+DEFAULT_CHANNELS = 2
+MP3_CHANNELS = 2
+DEFAULT_SAMPLE_RATE = 48000
+
+
+def pcm_format(targets):
+    # 16-bit targets decode to s16; anything deeper keeps 24-bit samples
+    # intact in an s32 container.
+    if all(target.bit_depth == '16-bit' for target in targets):
+        return 's16le', np.int16
+    return 's32le', np.int32
+
+
+def _start(stream, ffmpeg_path, **pipes):
+    process = stream.global_args('-loglevel', 'error').run_async(cmd=ffmpeg_path, pipe_stderr=True, **pipes)
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    reader.start()
+    return process, reader, errors
+
+
+def _wait(process, reader, errors):
+    returncode = process.wait()
+    reader.join()
+    return returncode, b''.join(errors).decode(errors='replace').strip()
+
+
+def _read_into(stream, view):
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def chunked_transcode(audio_file, targets, paths, ffmpeg_path='ffmpeg', sample_rate=None, chunk_frames=CHUNK_FRAMES, channels=None,
+                      gain=None, trim=None):
+    # One ffmpeg process decodes to raw PCM and one encoder per target reads
+    # it back, with a single preallocated NumPy buffer of chunk_frames frames
+    # shuttling between them. Peak memory is that buffer plus the pipe
+    # buffers, however long the track is. The decode keeps the source's
+    # sample rate and channel count, and only the MP3 encoders downmix, as
+    # libmp3lame takes at most two channels; gain and trim are applied by the
+    # decoder.
+    if sample_rate is None or channels is None:
+        try:
+            probe = probe_audio(audio_file, ffmpeg_path)
+            if probe is not None:
+                sample_rate = sample_rate or probe.sample_rate
+                channels = channels or probe.channels
+        except Exception as e:
+            print(f"Could not probe {audio_file}, decoding to {DEFAULT_SAMPLE_RATE} Hz stereo: {e}")
+    sample_rate = sample_rate or DEFAULT_SAMPLE_RATE
+    channels = channels or DEFAULT_CHANNELS
+    pcm, dtype = pcm_format(targets)
+
+    processes = []
+    try:
+        decoder = _start(
+            adjust_stream(ffmpeg.input(audio_file), gain, trim).output('pipe:1', f=pcm, acodec=f"pcm_{pcm}", ac=channels, ar=sample_rate),
+            ffmpeg_path,
+            pipe_stdout=True
+        )
+        processes.append(decoder)
+        encoders = []
+        for target, path in zip(targets, paths):
+            options = output_options(target.format, target.bitrate, target.sampling_rate)[1]
+            if target.format == 'mp3' and channels > MP3_CHANNELS:
+                options['ac'] = MP3_CHANNELS
+            stream = ffmpeg.input('pipe:0', f=pcm, ar=sample_rate, ac=channels).output(path, **options).overwrite_output()
+            encoders.append(_start(stream, ffmpeg_path, pipe_stdin=True))
+            processes.append(encoders[-1])
+
+        buffer = np.empty((chunk_frames, channels), dtype=dtype)
+        view = memoryview(buffer).cast('B')
+        frame_bytes = buffer.itemsize * channels
+        while True:
+            filled = _read_into(decoder[0].stdout, view)
+            frames = filled // frame_bytes
+            if frames:
+                for encoder in encoders:
+                    encoder[0].stdin.write(view[:frames * frame_bytes])
+            if filled < len(view):
+                break
+        for encoder in encoders:
+            encoder[0].stdin.close()
+    except BaseException as e:
+        for process, _, _ in processes:
+            process.kill()
+        messages = [message for _, message in (_wait(*process) for process in processes) if message]
+        _remove(paths)
+        if isinstance(e, BrokenPipeError):
+            raise RuntimeError(f"ffmpeg stopped early while converting {audio_file}: {'; '.join(messages)}") from e
+        raise
+
+    failures = []
+    for process in processes:
+        returncode, message = _wait(*process)
+        if returncode != 0:
+            failures.append(f"status {returncode}: {message}")
+    if failures:
+        _remove(paths)
+        raise RuntimeError(f"ffmpeg failed while converting {audio_file}: {'; '.join(failures)}")
+
+    return [TranscodeOutput(path, target.format, ENCODE) for target, path in zip(targets, paths)]
+
+
+def _remove(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
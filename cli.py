@@ -0,0 +1,149 @@
+import time
+
+_started = time.perf_counter()
+
+import argparse
+import contextlib
+import json
+import sys
+import threading
+
+from bandwidth import parse_rate
+from converter import (DEFAULT_DOWNLOAD_WORKERS, DEFAULT_LOUDNESS_TARGET, DEFAULT_TRANSCODE_WORKERS, close_journals, close_manifests, configure_bandwidth, create_scheduler,
+                       get_bandwidth_controller, get_session_pool, get_transcode_engine, manifest_counts, queue_batch, resume_batches)
+from extractors import LIBRARY_SOURCES
+from scheduler import FINISHED_STATES
+from transcoder import AUDIO_FORMATS, parse_targets
+
+CONVERSION_METHODS = ('Default', 'ffmpeg', 'pydub', 'chunked')
+BIT_DEPTHS = ('16-bit', '24-bit', '32-bit')
+
+
+class EventWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def read_urls(path):
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for line in stream:
+            url = line.strip()
+            if url and not url.startswith('#'):
+                yield url
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='audiophile', description="Download and convert YouTube audio without the GUI. "
+                                                                    "Progress is written to stdout as NDJSON, logs go to stderr.")
+    parser.add_argument('input', nargs='?', help="file with one URL per line, or - to read stdin (default unless --resume is given)")
+    parser.add_argument('-o', '--output-dir', default='output')
+    parser.add_argument('-f', '--format', choices=list(AUDIO_FORMATS), default='aac')
+    parser.add_argument('-b', '--bitrate', default='320k')
+    parser.add_argument('-r', '--sampling-rate', type=int, default=48000)
+    parser.add_argument('--bit-depth', choices=BIT_DEPTHS, default='24-bit')
+    parser.add_argument('-m', '--conversion-method', choices=CONVERSION_METHODS, default='Default')
+    parser.add_argument('-l', '--library-source', choices=LIBRARY_SOURCES, default='pytube')
+    parser.add_argument('--extra-targets', default='', help="additional outputs, e.g. 'flac, mp3:192k:44100'")
+    parser.add_argument('--streaming', action='store_true', help="pipe downloads straight into ffmpeg without temporary files")
+    parser.add_argument('--segmented', action='store_true', help="encode long tracks as parallel segments on all cores")
+    parser.add_argument('--normalize', nargs='?', type=float, const=DEFAULT_LOUDNESS_TARGET, metavar='LUFS',
+                        help=f"normalize integrated loudness (EBU R128) to LUFS, {DEFAULT_LOUDNESS_TARGET:g} if omitted")
+    parser.add_argument('--trim-silence', action='store_true', help="cut leading and trailing silence")
+    parser.add_argument('--download-workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS)
+    parser.add_argument('--transcode-workers', type=int, default=DEFAULT_TRANSCODE_WORKERS)
+    parser.add_argument('--max-bandwidth', type=parse_rate, help="cap total download speed in bytes/s, e.g. 2M or 500k")
+    parser.add_argument('--resume', action='store_true', help="re-queue unfinished jobs journaled in the output folder")
+    parser.add_argument('--metrics-file', help="append per-job stage timings here instead of to the output folder")
+    args = parser.parse_args(argv)
+    try:
+        parse_targets(args.extra_targets)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.input is None and not args.resume:
+        args.input = '-'
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    events = EventWriter(sys.stdout)
+    events.emit(
+        'startup',
+        seconds=round(time.perf_counter() - _started, 4),
+        qt_loaded=any(name.startswith('PyQt5') for name in sys.modules),
+        backends_loaded=[name for name in LIBRARY_SOURCES if name in sys.modules]
+    )
+
+    counts = {state: 0 for state in FINISHED_STATES}
+    counts_lock = threading.Lock()
+
+    def on_state_change(job):
+        error = str(job.error) if job.error is not None else None
+        events.emit('job', id=job.id, url=job.url, state=job.state, error=error, outputs=job.output)
+        if job.state in FINISHED_STATES:
+            if job.metrics is not None:
+                events.emit('metrics', id=job.id, **job.metrics.to_dict())
+            with counts_lock:
+                counts[job.state] += 1
+
+    configure_bandwidth(args.download_workers, args.max_bandwidth)
+    scheduler = create_scheduler(args.download_workers, args.transcode_workers, on_state_change, args.metrics_file)
+    batch_started = time.perf_counter()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            if args.resume:
+                jobs, batches = resume_batches(scheduler, args.output_dir)
+                events.emit('resume', jobs=jobs, batches=batches)
+            if args.input is not None:
+                queue_batch(
+                    scheduler,
+                    read_urls(args.input),
+                    output_dir=args.output_dir,
+                    format=args.format,
+                    bitrate=args.bitrate,
+                    sampling_rate=args.sampling_rate,
+                    bit_depth=args.bit_depth,
+                    conversion_method=args.conversion_method,
+                    library_source=args.library_source,
+                    streaming=args.streaming,
+                    extra_targets=args.extra_targets,
+                    segmented=args.segmented,
+                    normalize=args.normalize,
+                    trim_silence=args.trim_silence
+                )
+            scheduler.join()
+        except KeyboardInterrupt:
+            # Jobs are abandoned rather than cancelled, and the journal is
+            # closed first, so partial downloads and unfinished jobs stay
+            # resumable with --resume.
+            close_journals()
+            scheduler.shutdown(wait=False)
+        finally:
+            scheduler.shutdown()
+            manifest = dict(manifest_counts())
+            close_journals()
+            close_manifests()
+            get_transcode_engine().shutdown()
+            get_session_pool().close()
+
+    events.emit('summary', seconds=round(time.perf_counter() - batch_started, 3), manifest=manifest,
+                hosts=get_bandwidth_controller().stats(), **counts)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+import collections
+import os
+import threading
+
+from bandwidth import BandwidthController
+from downloader import SourceStream, download_file
+from extractors import resolve_source
+from journal import JOURNAL_FILE, JobJournal
+from manifest import MANIFEST_FILE, OutputManifest
+from metadata import MetadataCache, video_id
+from metrics import ANALYZE, CLEANUP, METRICS_FILE, RESOLVE, STREAM, TRANSCODE, JobMetrics, MetricsWriter, stage
+from scheduler import DONE, FAILED, FINISHED_STATES, SKIPPED, Job, JobScheduler, JobSkipped
+from playlists import expand_inputs
+from segmented import segmented_transcode
+from sessions import ExtractorSessionPool
+from streaming import NotStreamable, stream_transcode
+from transcoder import AUDIO_FORMATS, PCM_METHODS, OutputTarget, TranscodeEngine, parse_targets
+
+FFMPEG_PATH = r"PATH_TO_FFMPEG.EXE"
+preferred_conversion_method = 'ffmpeg'
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_TRANSCODE_WORKERS = os.cpu_count() or 1
+DEFAULT_BANDWIDTH_CAP = None
+DEFAULT_LOUDNESS_TARGET = -14.0
+transcode_engine = None
+bandwidth_controller = None
+metadata_cache = None
+session_pool = None
+journals = {}
+journals_lock = threading.Lock()
+manifests = {}
+manifests_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    global metadata_cache
+    if metadata_cache is None:
+        metadata_cache = MetadataCache()
+    return metadata_cache
+
+
+def get_session_pool():
+    global session_pool
+    if session_pool is None:
+        session_pool = ExtractorSessionPool()
+    return session_pool
+
+
+def get_bandwidth_controller():
+    global bandwidth_controller
+    if bandwidth_controller is None:
+        bandwidth_controller = BandwidthController(DEFAULT_DOWNLOAD_WORKERS, bandwidth_cap=DEFAULT_BANDWIDTH_CAP)
+    return bandwidth_controller
+
+
+def configure_bandwidth(download_workers=None, bandwidth_cap=None):
+    # The download worker count is the ceiling the per-host limits adapt
+    # under; bandwidth_cap is in bytes per second, None for unlimited.
+    get_bandwidth_controller().configure(download_workers, bandwidth_cap)
+
+
+def download_source(youtube_url, output_dir='output', library_source='pytube', job=None, metrics=None):
+    source = resolve_job_source(youtube_url, library_source, metrics)
+    return download_file(source, os.path.join(output_dir, '.sources'), job=job, metrics=metrics,
+                         bandwidth=get_bandwidth_controller())
+
+
+def resolve_job_source(youtube_url, library_source='pytube', metrics=None):
+    with stage(metrics, RESOLVE):
+        source = resolve_source(youtube_url, library_source, get_metadata_cache(), get_session_pool())
+    if metrics is not None:
+        metrics.media_duration = source.duration
+    return source
+
+
+def get_journal(output_dir, create=True):
+    path = os.path.abspath(os.path.join(output_dir or 'output', JOURNAL_FILE))
+    with journals_lock:
+        if path not in journals and create:
+            journals[path] = JobJournal(path)
+        return journals.get(path)
+
+
+def close_journals():
+    with journals_lock:
+        for journal in journals.values():
+            journal.close()
+        journals.clear()
+
+
+def get_manifest(output_dir):
+    path = os.path.abspath(os.path.join(output_dir or 'output', MANIFEST_FILE))
+    with manifests_lock:
+        if path not in manifests:
+            manifests[path] = OutputManifest(path)
+        return manifests[path]
+
+
+def manifest_counts():
+    with manifests_lock:
+        return sum((manifest.counts for manifest in manifests.values()), collections.Counter())
+
+
+def close_manifests():
+    with manifests_lock:
+        for manifest in manifests.values():
+            manifest.close()
+        manifests.clear()
+
+
+def processing_key(normalize=None, trim_silence=False):
+    # Part of the manifest's encode key, so normalized or trimmed outputs
+    # never stand in for plain ones and vice versa.
+    parts = []
+    if normalize is not None:
+        parts.append(f"loudnorm={float(normalize):g}")
+    if trim_silence:
+        parts.append('trim')
+    return '+'.join(parts)
+
+
+def find_outputs(youtube_url, output_dir, targets, conversion_method, processing=''):
+    return get_manifest(output_dir).lookup(video_id(youtube_url), targets, conversion_method, processing)
+
+
+def record_outputs(youtube_url, output_dir, targets, conversion_method, result, processing=''):
+    try:
+        get_manifest(output_dir).record(video_id(youtube_url), targets, conversion_method, [output.path for output in result.outputs],
+                                        processing)
+    except Exception as e:
+        print(f"Could not record outputs for {youtube_url}: {e}")
+
+
+def get_transcode_engine():
+    global transcode_engine
+    if transcode_engine is None:
+        transcode_engine = TranscodeEngine(max_workers=DEFAULT_TRANSCODE_WORKERS, ffmpeg_path=FFMPEG_PATH)
+    return transcode_engine
+
+
+def describe_outputs(result):
+    return ", ".join(f"{output.format} ({output.mode})" for output in result.outputs)
+
+
+def run_transcode(source, output_dir='output', conversion_method='ffmpeg', targets=None, job=None, metrics=None, segmented=False,
+                  normalize=None, trim_silence=False):
+    # normalize is a target loudness in LUFS. Downloaded sources are measured
+    # in one extra decode before the encode applies the gain and trim;
+    # streamed sources cannot be measured ahead and are converted as they are.
+    # Streams ffmpeg cannot decode from a pipe are downloaded after all.
+    result = None
+    if isinstance(source, SourceStream):
+        try:
+            with stage(metrics, STREAM):
+                result = stream_transcode(source, output_dir, ffmpeg_path=FFMPEG_PATH, job=job, targets=targets, metrics=metrics,
+                                          bandwidth=get_bandwidth_controller())
+        except NotStreamable as e:
+            print(f"{e}, downloading it instead.")
+            source = download_file(source, os.path.join(output_dir, '.sources'), job=job, metrics=metrics,
+                                   bandwidth=get_bandwidth_controller())
+    if result is None:
+        gain = trim = None
+        if normalize is not None or trim_silence:
+            from loudness import measure
+            with stage(metrics, ANALYZE):
+                gain, trim = measure(source, output_dir, FFMPEG_PATH, normalize, trim_silence)
+        with stage(metrics, TRANSCODE):
+            result = None
+            if segmented and conversion_method not in PCM_METHODS and trim is None:
+                result = segmented_transcode(source, output_dir, targets, FFMPEG_PATH, remove_source=False, gain=gain)
+            if result is None:
+                future = get_transcode_engine().submit(source, output_dir, conversion_method=conversion_method, targets=targets, remove_source=False,
+                                                       gain=gain, trim=trim)
+                result = future.result()
+                for message in result.messages:
+                    print(message)
+        with stage(metrics, CLEANUP):
+            os.remove(source)
+
+    if metrics is not None:
+        metrics.encode_seconds = result.elapsed
+        metrics.outputs = [output._asdict() for output in result.outputs]
+    return result
+
+
+def download_youtube_audio(youtube_url, output_dir='output', format='aac', bitrate='320k', sampling_rate=48000, bit_depth='24-bit', conversion_method='ffmpeg', library_source='pytube', streaming=False, targets=None, metrics=None, segmented=False, normalize=None, trim_silence=False):
+    os.makedirs(output_dir, exist_ok=True)
+    processing = processing_key(normalize, trim_silence)
+
+    try:
+        targets = list(targets or [OutputTarget(format, bitrate, sampling_rate, bit_depth)])
+        if any(target.format not in AUDIO_FORMATS for target in targets):
+            print("Invalid audio format selected.")
+            return
+        outputs = find_outputs(youtube_url, output_dir, targets, conversion_method, processing)
+        if outputs is not None:
+            if metrics is not None:
+                metrics.finish(SKIPPED)
+            print(f"Skipping {youtube_url}: its outputs already exist.")
+            return outputs[0] if len(outputs) == 1 else outputs
+        if streaming and conversion_method not in PCM_METHODS and not processing:
+            source = resolve_job_source(youtube_url, library_source, metrics)
+        else:
+            source = download_source(youtube_url, output_dir, library_source, metrics=metrics)
+        result = run_transcode(source, output_dir, conversion_method, targets, metrics=metrics, segmented=segmented, normalize=normalize,
+                               trim_silence=trim_silence)
+        record_outputs(youtube_url, output_dir, targets, conversion_method, result, processing)
+        if metrics is not None:
+            metrics.finish(DONE)
+        print(f"Conversion for {youtube_url} to {describe_outputs(result)} completed successfully in {result.elapsed:.2f}s.")
+        if len(result.outputs) == 1:
+            return result.outputs[0].path
+        return [output.path for output in result.outputs]
+    except Exception as e:
+        if metrics is not None:
+            metrics.finish(FAILED, e)
+        print(f"An error occurred for {youtube_url}: {e}")
+
+
+def job_processing(job):
+    return processing_key(job.options.get('normalize'), job.options.get('trim_silence', False))
+
+
+def job_streams(job):
+    # Loudness analysis needs the whole source before the encode starts.
+    return job.options.get('streaming') and job.options['conversion_method'] not in PCM_METHODS and not job_processing(job)
+
+
+def download_job(job):
+    outputs = find_outputs(job.url, job.options['output_dir'], job.options['targets'], job.options['conversion_method'], job_processing(job))
+    if outputs is not None:
+        raise JobSkipped(outputs)
+    if job_streams(job):
+        return resolve_job_source(job.url, job.options['library_source'], job.metrics)
+    return download_source(job.url, job.options['output_dir'], job.options['library_source'], job, job.metrics)
+
+
+def transcode_job(job, source):
+    result = run_transcode(source, job.options['output_dir'], job.options['conversion_method'], job.options['targets'], job, job.metrics,
+                           job.options.get('segmented', False), job.options.get('normalize'), job.options.get('trim_silence', False))
+    record_outputs(job.url, job.options['output_dir'], job.options['targets'], job.options['conversion_method'], result, job_processing(job))
+    print(f"{job.url}: {describe_outputs(result)} took {result.elapsed:.2f}s.")
+    return [output.path for output in result.outputs]
+
+
+def build_job(youtube_url, output_dir='output', format='aac', bitrate='320k', sampling_rate=48000, bit_depth='24-bit', conversion_method='ffmpeg', library_source='pytube', streaming=False, extra_targets='', segmented=False,
+              normalize=None, trim_silence=False):
+    targets = [OutputTarget(format, bitrate, sampling_rate, bit_depth)]
+    targets += parse_targets(extra_targets)
+    job = Job(youtube_url,
+              output_dir=output_dir or 'output',
+              format=format,
+              bitrate=bitrate,
+              sampling_rate=sampling_rate,
+              bit_depth=bit_depth,
+              conversion_method=conversion_method,
+              library_source=library_source,
+              streaming=streaming,
+              segmented=segmented,
+              normalize=normalize,
+              trim_silence=trim_silence,
+              targets=targets)
+    job.metrics = JobMetrics(youtube_url, job.id)
+    return job
+
+
+def journaled_inputs(journal, batch_id, urls):
+    for url in urls:
+        yield journal.add_input(batch_id, url), url
+
+
+def journaled_jobs(journal, batch_id, inputs, options, known=(), on_input=None):
+    # Expands the batch lazily like any other feed, skipping videos the journal
+    # already holds a job for. Every job remembers the (batch, input id) it
+    # came from, and on_input(batch, input_id, jobs) is called once each input
+    # is exhausted, then with input_id None when the feed ends. The batch is
+    # released once the feed ends, whether it ran out or was stopped.
+    batch = (options['output_dir'], batch_id)
+    count = 0
+    try:
+        for input_id, url in expand_inputs(inputs, options['library_source'], get_session_pool()):
+            if url is None:
+                if on_input is not None:
+                    on_input(batch, input_id, count)
+                count = 0
+                continue
+            if video_id(url) in known:
+                continue
+            job = build_job(url, **options)
+            job.input = (batch, input_id)
+            journal.attach(job, batch_id)
+            count += 1
+            yield job
+    finally:
+        journal.release_batch(batch_id)
+        if on_input is not None:
+            on_input(batch, None, 0)
+
+
+def queue_batch(scheduler, urls, on_input=None, **options):
+    # Returns the (output_dir, batch_id) key the batch's jobs and on_input
+    # calls refer to.
+    options['output_dir'] = options.get('output_dir') or 'output'
+    journal = get_journal(options['output_dir'])
+    batch_id = journal.start_batch(options)
+    scheduler.submit_iter(journaled_jobs(journal, batch_id, journaled_inputs(journal, batch_id, urls), options, on_input=on_input))
+    return options['output_dir'], batch_id
+
+
+def resume_batches(scheduler, output_dir='output'):
+    # Jobs that never finished are queued again first; their partial sources
+    # resume from where the download stopped. Batches that were still being
+    # expanded then continue with the inputs they had not reached.
+    journal = get_journal(output_dir)
+    jobs = journal.unfinished_jobs()
+    for row_id, batch_id, url, options in jobs:
+        job = build_job(url, **options)
+        journal.attach(job, batch_id, row_id)
+        scheduler.submit(job)
+    batches = journal.claim_open_batches()
+    for batch_id, options, inputs, known in batches:
+        scheduler.submit_iter(journaled_jobs(journal, batch_id, inputs, options, known))
+    return len(jobs), len(batches)
+
+
+def create_scheduler(download_workers=DEFAULT_DOWNLOAD_WORKERS, transcode_workers=DEFAULT_TRANSCODE_WORKERS, on_state_change=None, metrics_file=None):
+    # Finished jobs append their metrics to metrics_file, or to a JSON-lines
+    # file in their own output folder when none is given. The transcode
+    # engine's pool is sized to match the transcode workers.
+    writer = MetricsWriter(metrics_file)
+    get_transcode_engine().resize(transcode_workers)
+
+    def state_changed(job):
+        journal = get_journal(job.options['output_dir'], create=False)
+        if journal is not None:
+            try:
+                journal.record(job)
+            except Exception as e:
+                print(f"Could not journal {job.url}: {e}")
+        if job.state in FINISHED_STATES and job.metrics is not None:
+            job.metrics.finish(job.state, job.error)
+            try:
+                writer.write(job.metrics.to_dict(), metrics_file or os.path.join(job.options['output_dir'], METRICS_FILE))
+            except OSError as e:
+                print(f"Could not write metrics for {job.url}: {e}")
+        if on_state_change is not None:
+            on_state_change(job)
+
+    return JobScheduler(
+        download_job,
+        transcode_job,
+        download_workers=download_workers,
+        transcode_workers=transcode_workers,
+        on_state_change=state_changed,
+        discard_source=discard_source
+    )
+
+
+def discard_source(job, source):
+    if isinstance(source, SourceStream):
+        return
+    if os.path.exists(source):
+        os.remove(source)
@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import urllib.error
+import urllib.request
+from collections import namedtuple
+
+from bandwidth import backoff_delay, host_slot
+from metrics import DOWNLOAD, stage
+from scheduler import JobCancelled
+
+CHUNK_SIZE = 256 * 1024
+REQUEST_TIMEOUT = 30
+
+_CONTENT_RANGE = re.compile(r'^bytes (?:(\d+)-\d+|\*)/(\d+|\*)$')
+
+SourceStream = namedtuple('SourceStream', ['url', 'headers', 'name', 'probe', 'ext', 'duration'], defaults=[None, None, None])
+
+
+def open_url(url, headers=None, timeout=REQUEST_TIMEOUT):
+    request = urllib.request.Request(url, headers=headers or {})
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def read_chunks(response, chunk_size=CHUNK_SIZE, job=None, metrics=None, limiter=None):
+    while True:
+        if job is not None:
+            job.check_cancelled()
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        if metrics is not None:
+            metrics.add_bytes(len(chunk))
+        if limiter is not None:
+            limiter.transferred(len(chunk))
+        yield chunk
+
+
+def iter_chunks(url, headers=None, chunk_size=CHUNK_SIZE, job=None, metrics=None, bandwidth=None):
+    # A stream cannot be resumed part way, so throttling is only retried
+    # while opening it.
+    attempts = 0
+    while True:
+        with host_slot(bandwidth, url, job, metrics) as limiter:
+            try:
+                response = open_url(url, headers)
+            except urllib.error.HTTPError as e:
+                delay = backoff_delay(e, limiter, attempts)
+                attempts += 1
+                print(f"Throttled by {limiter.host}, retrying in {delay:.1f}s")
+                continue
+            if limiter is not None:
+                limiter.recovered()
+            with response:
+                yield from read_chunks(response, chunk_size, job, metrics, limiter)
+            return
+
+
+def _content_range(value):
+    # "bytes 100-199/1000" -> (100, 1000); "bytes */1000" -> (None, 1000)
+    match = _CONTENT_RANGE.match(value or '')
+    if match is None:
+        return None, None
+    start, total = match.groups()
+    return (int(start) if start is not None else None), (int(total) if total != '*' else None)
+
+
+def _validator(headers):
+    # If-Range only accepts a strong ETag or a Last-Modified date.
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _resource_size(response):
+    if response.status == 206:
+        return _content_range(response.headers.get('Content-Range'))[1]
+    length = response.headers.get('Content-Length')
+    return int(length) if length is not None else None
+
+
+def _load_resume_state(path):
+    try:
+        with open(path, encoding='utf-8') as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return None, None
+    return state.get('validator'), state.get('size')
+
+
+def _save_resume_state(path, validator, size):
+    with open(path, 'w', encoding='utf-8') as state_file:
+        json.dump({'validator': validator, 'size': size}, state_file)
+
+
+def open_resumable(url, headers=None, offset=0, validator=None, size=None, timeout=REQUEST_TIMEOUT):
+    # Returns the response together with the offset its body starts at, which
+    # is 0 whenever the server ignores or rejects the range, or the resource
+    # no longer matches the validator and total size recorded when the
+    # partial file was started. A None response means the partial file
+    # already holds the whole resource.
+    if not offset or (validator is None and size is None):
+        return open_url(url, headers, timeout), 0
+
+    range_headers = dict(headers or {}, Range=f"bytes={offset}-")
+    if validator is not None:
+        range_headers['If-Range'] = validator
+    try:
+        response = open_url(url, range_headers, timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 416:
+            raise
+        _, total = _content_range(e.headers.get('Content-Range'))
+        e.close()
+        if total == offset and size == offset:
+            return None, offset
+        return open_url(url, headers, timeout), 0
+
+    if response.status != 206:
+        return response, 0
+    start, total = _content_range(response.headers.get('Content-Range'))
+    current = _validator(response.headers)
+    if start == offset and (size is None or total == size) and (validator is None or current in (None, validator)):
+        return response, offset
+    response.close()
+    return open_url(url, headers, timeout), 0
+
+
+def download_file(source, directory, chunk_size=CHUNK_SIZE, job=None, metrics=None, bandwidth=None):
+    # Interrupted downloads leave their .part file behind, with the resource's
+    # validator and size in a .part.json file next to it, and the next
+    # attempt continues it with an If-Range request. Only cancellation
+    # discards them. With a bandwidth controller the download waits for a
+    # slot on its host, and a throttled request gives the slot back until the
+    # host's backoff ends; only the time holding a slot counts as download.
+    os.makedirs(directory, exist_ok=True)
+    extension = f".{source.ext}" if source.ext else ''
+    path = os.path.join(directory, source.name + extension)
+    partial_path = path + '.part'
+    state_path = partial_path + '.json'
+
+    attempts = 0
+    try:
+        while True:
+            offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            validator, size = _load_resume_state(state_path) if offset else (None, None)
+            with host_slot(bandwidth, source.url, job, metrics) as limiter, stage(metrics, DOWNLOAD):
+                try:
+                    response, offset = open_resumable(source.url, source.headers, offset, validator, size)
+                except urllib.error.HTTPError as e:
+                    delay = backoff_delay(e, limiter, attempts)
+                    attempts += 1
+                    print(f"{source.name} throttled by {limiter.host}, retrying in {delay:.1f}s")
+                    continue
+                if limiter is not None:
+                    limiter.recovered()
+                if response is not None:
+                    with response, open(partial_path, 'r+b' if offset else 'wb') as partial_file:
+                        if not offset:
+                            _save_resume_state(state_path, _validator(response.headers), _resource_size(response))
+                        partial_file.seek(offset)
+                        partial_file.truncate()
+                        length = response.headers.get('Content-Length')
+                        for chunk in read_chunks(response, chunk_size, job, metrics, limiter):
+                            partial_file.write(chunk)
+                        if length is not None and partial_file.tell() != offset + int(length):
+                            raise IOError(f"Download of {source.name} ended after {partial_file.tell()} of {offset + int(length)} bytes.")
+            break
+    except JobCancelled:
+        for leftover in (partial_path, state_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    os.replace(partial_path, path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return path
@@ -0,0 +1,111 @@
+import importlib
+import os
+import time
+import urllib.parse
+
+from downloader import SourceStream
+from metadata import cached_fetch, video_id
+from transcoder import AudioProbe, normalize_codec
+
+LIBRARY_SOURCES = ('pytube', 'youtube_dl', 'yt_dlp')
+EXPIRY_MARGIN = 5 * 60
+
+YDL_OPTIONS = {
+    'format': 'bestaudio[protocol^=http]/bestaudio/best',
+    'outtmpl': '%(title)s.%(ext)s',
+    'quiet': True,
+    'no_warnings': True,
+}
+
+
+def load_backend(library_source):
+    # Backends are imported on first use so a batch only pays for the
+    # library it actually selected.
+    if library_source not in LIBRARY_SOURCES:
+        raise ValueError(f"Invalid library source selected: {library_source}")
+    return importlib.import_module(library_source)
+
+
+def _fetch_pytube(backend, youtube_url):
+    yt = backend.YouTube(youtube_url)
+    audio_stream = yt.streams.filter(only_audio=True).first()
+    return {
+        'title': yt.title,
+        'author': yt.author,
+        'duration': yt.length,
+        'source': {
+            'url': audio_stream.url,
+            'headers': {},
+            'name': os.path.splitext(audio_stream.default_filename)[0],
+            'ext': audio_stream.subtype,
+            'codec': normalize_codec(audio_stream.audio_codec),
+            'sample_rate': None,
+            'bitrate': int(audio_stream.abr.rstrip('kbps')) * 1000 if audio_stream.abr else None,
+        },
+    }
+
+
+def _extract_ydl(ydl, youtube_url):
+    info = ydl.extract_info(youtube_url, download=False)
+    name = os.path.splitext(ydl.prepare_filename(info))[0]
+    return {
+        'title': info.get('title'),
+        'author': info.get('uploader') or info.get('channel'),
+        'duration': info.get('duration'),
+        'source': {
+            'url': info['url'],
+            'headers': info.get('http_headers', {}),
+            'name': name,
+            'ext': info.get('ext'),
+            'codec': normalize_codec(info.get('acodec')),
+            'sample_rate': info.get('asr'),
+            'bitrate': int(info['abr'] * 1000) if info.get('abr') else None,
+        },
+    }
+
+
+def fetch_metadata(youtube_url, library_source='pytube', sessions=None):
+    backend = load_backend(library_source)
+    if library_source == 'pytube':
+        data = _fetch_pytube(backend, youtube_url)
+    elif sessions is not None:
+        with sessions.session(library_source) as ydl:
+            data = _extract_ydl(ydl, youtube_url)
+    else:
+        with backend.YoutubeDL(dict(YDL_OPTIONS)) as ydl:
+            data = _extract_ydl(ydl, youtube_url)
+    data['video_id'] = video_id(youtube_url)
+    data['library_source'] = library_source
+    return data
+
+
+def source_expired(source_url, margin=EXPIRY_MARGIN):
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(source_url).query)
+    expire = query.get('expire')
+    if not expire:
+        return False
+    try:
+        return float(expire[0]) - margin < time.time()
+    except ValueError:
+        return False
+
+
+def source_from_metadata(data):
+    source = data['source']
+    probe = AudioProbe(source.get('codec'), source.get('sample_rate'), source.get('bitrate'))
+    return SourceStream(source['url'], source.get('headers') or {}, source['name'], probe, source.get('ext'), data.get('duration'))
+
+
+def resolve_metadata(youtube_url, library_source='pytube', cache=None, sessions=None):
+    # Signed stream URLs expire long before the cache TTL, so an entry whose
+    # stream URL is stale is refreshed even though its title is still good.
+    data = cached_fetch(youtube_url, lambda url: fetch_metadata(url, library_source, sessions), cache)
+    if source_expired(data['source']['url']):
+        data = fetch_metadata(youtube_url, library_source, sessions)
+        if cache is not None:
+            cache.put(data['video_id'], data)
+    return data
+
+
+def resolve_source(youtube_url, library_source='pytube', cache=None, sessions=None):
+    return source_from_metadata(resolve_metadata(youtube_url, library_source, cache, sessions))
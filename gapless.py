@@ -0,0 +1,193 @@
+import os
+import shutil
+import struct
+
+# Samples the MP3 decoder itself adds in front of the stream; a LAME tag's
+# encoder delay counts only what the encoder added beyond it.
+MP3_DECODER_DELAY = 529
+
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+XING_FLAGS = 0x0f
+TOC_SIZE = 100
+LAME_VERSION = b'LAME3.100'
+LAME_TAG_SIZE = 36
+COPY_SIZE = 1024 * 1024
+
+# Movie-level boxes that lead to the durations; everything else is skipped.
+MP4_CONTAINERS = (b'moov', b'trak', b'edts')
+
+
+def _crc16(data, crc=0):
+    # CRC-16/ARC, which LAME uses for its tag.
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def _mp3_header(data):
+    # Returns (version id, sample rate, channels, samples per frame) of the
+    # first frame header in data, and its offset.
+    offset = data.find(b'\xff')
+    while offset != -1 and offset + 4 <= len(data):
+        header = data[offset:offset + 4]
+        version = (header[1] >> 3) & 3
+        if header[1] & 0xe0 == 0xe0 and version != 1 and (header[1] >> 1) & 3 == 1 and (header[2] >> 2) & 3 != 3:
+            sample_rate = MP3_SAMPLE_RATES[version][(header[2] >> 2) & 3]
+            channels = 1 if header[3] >> 6 == 3 else 2
+            return offset, (version, sample_rate, channels, 1152 if version == 3 else 576)
+        offset = data.find(b'\xff', offset + 1)
+    raise ValueError("No MP3 frame header found")
+
+
+def _info_frame(header, version, sample_rate, channels, frames, audio_bytes, start_pad, end_pad):
+    # An empty Layer III frame carrying a Xing "Info" tag and LAME extension,
+    # laid out as ffmpeg's muxer writes it: frame count, byte count, a
+    # linear seek table, then the encoder delay and padding.
+    side_info = (32 if channels == 2 else 17) if version == 3 else (17 if channels == 2 else 9)
+    offset = 4 + side_info
+    needed = offset + 16 + TOC_SIZE + 4 + LAME_TAG_SIZE
+    table = MP3_BITRATES[1 if version == 3 else 2]
+    coefficient = 144 if version == 3 else 72
+    for index in range(1, len(table)):
+        size = coefficient * table[index] * 1000 // sample_rate
+        if size >= needed:
+            break
+    else:
+        raise ValueError("No MP3 frame size holds the LAME tag")
+
+    frame = bytearray(size)
+    frame[0:4] = bytes((header[0], header[1] | 1, (index << 4) | (header[2] & 0x0c), header[3]))
+    toc = bytes(min(255, step * 256 // TOC_SIZE) for step in range(TOC_SIZE))
+    total_bytes = audio_bytes + size
+    frame[offset:offset + 16] = b'Info' + struct.pack('>III', XING_FLAGS, frames, total_bytes)
+    frame[offset + 16:offset + 16 + TOC_SIZE] = toc
+    lame = offset + 16 + TOC_SIZE + 4
+    padding = (min(start_pad, 4095) << 12) | min(max(end_pad, 0), 4095)
+    frame[lame:lame + 9] = LAME_VERSION
+    frame[lame + 21:lame + 24] = padding.to_bytes(3, 'big')
+    frame[lame + 28:lame + 32] = struct.pack('>I', total_bytes)
+    frame[lame + 34:lame + 36] = struct.pack('>H', _crc16(frame[:lame + 34]))
+    return bytes(frame)
+
+
+def write_mp3(body_path, output_path, delay, total_samples):
+    # Writes the raw MP3 frames in body_path to output_path behind a LAME tag
+    # that tells decoders to drop delay samples at the start and everything
+    # after total_samples, as a single-pass encode would.
+    audio_bytes = os.path.getsize(body_path)
+    with open(body_path, 'rb') as body:
+        first = body.read(COPY_SIZE)
+        start, (version, sample_rate, channels, frame_samples) = _mp3_header(first)
+        header = first[start:start + 4]
+        frames = _count_mp3_frames(body, start)
+        start_pad = delay - MP3_DECODER_DELAY
+        end_pad = frames * frame_samples - delay - total_samples + MP3_DECODER_DELAY
+        with open(output_path, 'wb') as output:
+            output.write(_info_frame(header, version, sample_rate, channels, frames, audio_bytes - start, start_pad, end_pad))
+            body.seek(start)
+            shutil.copyfileobj(body, output, COPY_SIZE)
+
+
+def _count_mp3_frames(body, start):
+    # Walks the frame headers; the segments are CBR without a reservoir, but
+    # padding bits still vary the frame length.
+    body.seek(start)
+    frames = 0
+    while True:
+        header = body.read(4)
+        if len(header) < 4 or header[0] != 0xff or header[1] & 0xe0 != 0xe0:
+            return frames
+        version = (header[1] >> 3) & 3
+        bitrate = MP3_BITRATES[1 if version == 3 else 2][header[2] >> 4]
+        sample_rate = MP3_SAMPLE_RATES[version][(header[2] >> 2) & 3]
+        size = (144 if version == 3 else 72) * bitrate * 1000 // sample_rate + ((header[2] >> 1) & 1)
+        if size <= 4:
+            return frames
+        frames += 1
+        body.seek(size - 4, os.SEEK_CUR)
+
+
+def _boxes(data, start, end):
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def set_mp4_edit(path, skip, total_samples):
+    # Points the file's edit at skip samples into the media and makes it, and
+    # the track and movie durations, total_samples long, as a single-pass
+    # encode would. The file must already have an edit (ffmpeg writes one
+    # when the first packet has a negative timestamp) and a movie timescale
+    # equal to the sample rate, so the edit can express single samples. Only
+    # the moov box is read, and it keeps its size.
+    with open(path, 'r+b') as mp4:
+        size = os.fstat(mp4.fileno()).st_size
+        offset = 0
+        while offset + 8 <= size:
+            mp4.seek(offset)
+            box_size, kind = struct.unpack('>I4s', mp4.read(8))
+            if box_size == 1:
+                box_size = struct.unpack('>Q', mp4.read(8))[0]
+            elif box_size == 0:
+                box_size = size - offset
+            if box_size < 8:
+                break
+            if kind == b'moov':
+                mp4.seek(offset)
+                data = bytearray(mp4.read(box_size))
+                if not _patch_durations(data, *next(_boxes(data, 0, len(data)))[1:], skip, total_samples):
+                    raise ValueError(f"No edit list in {path}")
+                mp4.seek(offset)
+                mp4.write(data)
+                return
+            offset += box_size
+    raise ValueError(f"No moov box in {path}")
+
+
+def _patch_durations(data, start, end, skip, total_samples):
+    # Returns how many edits were patched.
+    edits = 0
+    for kind, box_start, box_end in _boxes(data, start, end):
+        if kind in MP4_CONTAINERS:
+            edits += _patch_durations(data, box_start, box_end, skip, total_samples)
+        elif kind == b'mvhd':
+            _patch_field(data, box_start, total_samples, 16, 24)
+        elif kind == b'tkhd':
+            _patch_field(data, box_start, total_samples, 20, 28)
+        elif kind == b'elst':
+            version = data[box_start]
+            count = struct.unpack('>I', data[box_start + 4:box_start + 8])[0]
+            layout = '>Ii' if version == 0 else '>Qq'
+            entry = 12 if version == 0 else 20
+            for index in range(count):
+                offset = box_start + 8 + index * entry
+                # Empty edits (media time -1) only delay the start and stay.
+                if struct.unpack_from(layout, data, offset)[1] >= 0:
+                    struct.pack_into(layout, data, offset, total_samples, skip)
+                    edits += 1
+    return edits
+
+
+def _patch_field(data, box_start, value, offset_v0, offset_v1):
+    # Full boxes store their duration in 32 bits for version 0, 64 for 1.
+    if data[box_start] == 0:
+        struct.pack_into('>I', data, box_start + offset_v0, value)
+    else:
+        struct.pack_into('>Q', data, box_start + offset_v1, value)
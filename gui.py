@@ -0,0 +1,946 @@
+import collections
+import itertools
+import os
+import sys
+import threading
+import urllib.parse
+from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QPushButton, QLineEdit, QVBoxLayout, QHBoxLayout, QWidget, QFileDialog, QComboBox, QDialog, QFormLayout, QColorDialog, QFontDialog, QSpinBox, QCheckBox, QTextEdit, QPlainTextEdit, QTextBrowser, QTableView, QHeaderView, QAbstractItemView, QStyledItemDelegate, QStyleOptionProgressBar, QStyle, QShortcut
+from PyQt5.QtGui import QIcon, QTextCursor, QColor, QTextCharFormat, QKeySequence
+from PyQt5.QtCore import Qt, QObject, QTimer, QAbstractTableModel, QModelIndex, pyqtSignal
+from converter import DEFAULT_DOWNLOAD_WORKERS, DEFAULT_LOUDNESS_TARGET, DEFAULT_TRANSCODE_WORKERS, close_journals, close_manifests, configure_bandwidth, create_scheduler, download_youtube_audio, get_metadata_cache, get_session_pool, get_transcode_engine, queue_batch, resume_batches
+from extractors import fetch_metadata
+from logsink import DEFAULT_MAX_LINES, ERR, OUT, LogSink, default_log_path
+from metadata import resolve_all
+from scheduler import FINISHED_STATES
+from transcoder import PCM_METHODS, parse_targets
+
+KEPT_QUERY_PARAMS = ('v', 'list')
+LOG_FLUSH_INTERVAL_MS = 100
+QUEUE_REFRESH_INTERVAL_MS = 250
+BITRATES = ['320k', '640k', '1411k', '1920k', '2560k', '3200k', '3840k', '4599k']
+OPUS_BITRATES = ['96k', '128k', '160k', '256k', '320k', '510k']
+
+def sanitize_url(url):
+    parsed_url = urllib.parse.urlparse(url.strip())
+    query = [(key, value) for key, value in urllib.parse.parse_qsl(parsed_url.query) if key in KEPT_QUERY_PARAMS]
+    url_sanitized = urllib.parse.urlunparse(parsed_url._replace(query=urllib.parse.urlencode(query)))
+    return urllib.parse.quote(url_sanitized, safe=':/?=&')
+
+class DownloadWorker(QObject):
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, youtube_url, output_dir, audio_format, bitrate, sampling_rate, bit_depth, conversion_method, library_source):
+        super().__init__()
+        self.youtube_url = youtube_url
+        self.output_dir = output_dir
+        self.audio_format = audio_format
+        self.bitrate = bitrate
+        self.sampling_rate = sampling_rate
+        self.bit_depth = bit_depth
+        self.conversion_method = conversion_method
+        self.library_source = library_source
+
+    def download_and_convert(self):
+        try:
+            download_youtube_audio(
+                self.youtube_url,
+                self.output_dir,
+                self.audio_format,
+                self.bitrate,
+                self.sampling_rate,
+                self.bit_depth,
+                self.conversion_method,
+                self.library_source
+            )
+            print(f"Conversion for {self.youtube_url} to {self.audio_format} completed successfully.")
+            self.finished.emit(f"Conversion for {self.youtube_url} to {self.audio_format} completed successfully.")
+        except Exception as e:
+            error_message = f"An error occurred for {self.youtube_url}: {e}"
+            print(error_message)
+            self.error.emit(error_message)
+
+class JobSignals(QObject):
+    state_changed = pyqtSignal(int, str, str, str)
+    job_updated = pyqtSignal(object)
+    input_expanded = pyqtSignal(object, object, int)
+    metrics_recorded = pyqtSignal(object)
+
+    def emit_job(self, job):
+        error = str(job.error) if job.error is not None else ''
+        self.state_changed.emit(job.id, job.url, job.state, error)
+        self.job_updated.emit(job)
+        if job.state in FINISHED_STATES and job.metrics is not None:
+            self.metrics_recorded.emit(job.metrics.to_dict())
+
+class MetadataSignals(QObject):
+    resolved = pyqtSignal(int, str, object, str)
+    finished = pyqtSignal(int)
+
+class Console(QTextEdit):
+    COLORS = {OUT: QColor(0, 255, 0), ERR: QColor(255, 0, 0)}
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES):
+        super().__init__()
+        self.setStyleSheet("background-color: black; color: lightgreen;")
+        self.setReadOnly(True)
+        self.document().setMaximumBlockCount(max_lines)
+
+    def append_lines(self, lines, dropped=0):
+        if dropped:
+            lines = [(ERR, f"... {dropped} lines skipped, see {default_log_path()} ...")] + lines
+        scroll_bar = self.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for channel, group in itertools.groupby(lines, key=lambda line: line[0]):
+            text_format = QTextCharFormat()
+            text_format.setForeground(self.COLORS[channel])
+            if not self.document().isEmpty():
+                cursor.insertBlock()
+            cursor.insertText("\n".join(line for _, line in group), text_format)
+        cursor.endEditBlock()
+
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def append_message(self, message, color=QColor(0, 255, 0)):
+        self.setTextColor(color)
+        self.append(message)
+
+    def append_error(self, error_message):
+        self.append_message(error_message, color=QColor(255, 0, 0))
+
+def read_url_lines(text):
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield from line.split()
+
+class QueueRow:
+    __slots__ = ('url', 'title', 'author', 'state', 'error', 'job', 'batch', 'input', 'expanded')
+
+    def __init__(self, url):
+        self.url = url
+        self.title = ''
+        self.author = ''
+        self.state = ''
+        self.error = ''
+        self.job = None
+        self.batch = None
+        self.input = None
+        self.expanded = 0
+
+class UrlQueueModel(QAbstractTableModel):
+    # One row per queued URL or job. Worker signals only mark rows dirty;
+    # flush() turns them into a single dataChanged per refresh, so thousands
+    # of rows updating at once cost one repaint of the visible ones. Submitted
+    # rows are matched to the journal's input ids in submission order, and a
+    # row whose input expanded into other videos ends up 'expanded'.
+    COLUMNS = ("URL", "Title", "State", "Progress", "Output")
+    URL, TITLE, STATE, PROGRESS, OUTPUT = range(len(COLUMNS))
+    SUBMITTED = 'submitted'
+    EXPANDED = 'expanded'
+    STATE_PROGRESS = {'pending': 0, 'downloading': 10, 'downloaded': 50, 'transcoding': 60, 'done': 100, 'skipped': 100, 'expanded': 100}
+    STATE_COLORS = {'done': QColor(0, 160, 0), 'skipped': QColor(0, 120, 200), 'expanded': QColor(0, 120, 200),
+                    'failed': QColor(255, 0, 0), 'cancelled': QColor(128, 128, 128)}
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._rows_by_url = {}
+        self._rows_by_job = {}
+        self._rows_by_input = {}
+        self._waiting = {}
+        self._active = set()
+        self._dirty = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        return self.COLUMNS[section] if orientation == Qt.Horizontal else section + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == self.URL:
+                return row.url
+            if column == self.TITLE:
+                return row.title
+            if column == self.STATE:
+                return row.state
+            if column == self.PROGRESS:
+                return self.progress_text(row)
+            return ", ".join(os.path.basename(path) for path in self.outputs(row))
+        if role == Qt.UserRole and column == self.PROGRESS:
+            return self.STATE_PROGRESS.get(row.state)
+        if role == Qt.ForegroundRole and column == self.STATE:
+            return self.STATE_COLORS.get(row.state)
+        if role == Qt.ToolTipRole:
+            if column == self.TITLE and row.author:
+                return f"Artist: {row.author}"
+            if column == self.STATE and row.error:
+                return row.error
+            if column == self.OUTPUT:
+                return "\n".join(self.outputs(row)) or None
+        return None
+
+    def outputs(self, row):
+        output = row.job.output if row.job is not None else None
+        if not output:
+            return []
+        return [output] if isinstance(output, str) else list(output)
+
+    def progress_text(self, row):
+        if row.state == self.EXPANDED:
+            return f"{row.expanded} jobs"
+        if row.state == 'downloading' and row.job.metrics is not None and row.job.metrics.bytes_downloaded:
+            return f"{row.job.metrics.bytes_downloaded / 1e6:.1f} MB"
+        progress = self.STATE_PROGRESS.get(row.state)
+        return f"{progress}%" if progress is not None else ''
+
+    def add_urls(self, urls):
+        fresh = []
+        for url in urls:
+            if not url.strip():
+                continue
+            url = sanitize_url(url)
+            if url not in self._rows_by_url:
+                self._rows_by_url[url] = []
+                fresh.append(url)
+        if fresh:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(fresh) - 1)
+            for url in fresh:
+                self._rows_by_url[url].append(len(self.rows))
+                self.rows.append(QueueRow(url))
+            self.endInsertRows()
+        return len(fresh)
+
+    def _append(self, url):
+        index = len(self.rows)
+        self.beginInsertRows(QModelIndex(), index, index)
+        self.rows.append(QueueRow(url))
+        self._rows_by_url.setdefault(url, []).append(index)
+        self.endInsertRows()
+        return index
+
+    def submittable_rows(self, indices=None):
+        # Rows that were never queued, or whose last job failed or was cancelled.
+        indices = range(len(self.rows)) if indices is None else indices
+        return [index for index in indices if self.rows[index].state in ('', 'failed', 'cancelled')]
+
+    def mark_submitted(self, indices, batch):
+        for index in indices:
+            row = self.rows[index]
+            row.state = self.SUBMITTED
+            row.error = ''
+            row.batch = batch
+            row.input = None
+            self._waiting.setdefault(batch, collections.deque()).append(index)
+            self._dirty.add(index)
+
+    def _input_row(self, batch, input_id):
+        # Inputs are reported in the order their rows were submitted, so an
+        # input id seen for the first time belongs to its batch's oldest
+        # waiting row.
+        key = (batch, input_id)
+        index = self._rows_by_input.get(key)
+        if index is None:
+            waiting = self._waiting.get(batch)
+            if not waiting:
+                return None
+            index = waiting.popleft()
+            if not waiting:
+                del self._waiting[batch]
+            self.rows[index].input = key
+            self._rows_by_input[key] = index
+        return index
+
+    def update_job(self, job):
+        # The first update of a job claims the row of the input it came from
+        # when that input is the video itself; playlist entries and resumed
+        # jobs get a row of their own.
+        index = self._rows_by_job.get(job.id)
+        if index is None:
+            if job.input is not None:
+                index = self._input_row(*job.input)
+            if index is None or self.rows[index].url != job.url:
+                index = self._append(job.url)
+            previous = self.rows[index].job
+            if previous is not None:
+                self._rows_by_job.pop(previous.id, None)
+            self.rows[index].job = job
+            self._rows_by_job[job.id] = index
+
+        row = self.rows[index]
+        row.state = job.state
+        row.error = str(job.error) if job.error is not None else ''
+        if job.state in FINISHED_STATES:
+            self._active.discard(index)
+        else:
+            self._active.add(index)
+        self._dirty.add(index)
+
+    def input_expanded(self, batch, input_id, jobs):
+        # An input none of whose videos claimed its row was a playlist, or
+        # only held videos that were already queued or converted. Once the
+        # batch's feed ends, rows it never finished were cancelled.
+        if input_id is None:
+            unfinished = list(self._waiting.pop(batch, ()))
+            for key in [key for key in self._rows_by_input if key[0] == batch]:
+                index = self._rows_by_input.pop(key)
+                if self.rows[index].state == self.SUBMITTED:
+                    unfinished.append(index)
+            for index in unfinished:
+                self.rows[index].state = 'cancelled'
+                self._dirty.add(index)
+            return
+        index = self._input_row(batch, input_id)
+        if index is None:
+            return
+        row = self.rows[index]
+        if row.job is not None and row.job.input == row.input:
+            return
+        row.state = self.EXPANDED if jobs else 'skipped'
+        row.expanded = jobs
+        row.error = '' if jobs else "Already queued or converted"
+        self._dirty.add(index)
+
+    def set_metadata(self, url, title, author):
+        for index in self._rows_by_url.get(url, ()):
+            self.rows[index].title = title
+            self.rows[index].author = author
+            self._dirty.add(index)
+
+    def urls(self, indices=None):
+        indices = range(len(self.rows)) if indices is None else indices
+        return [self.rows[index].url for index in indices]
+
+    def flush(self):
+        # Active rows are refreshed every time so their byte counts move.
+        changed = self._dirty | self._active
+        self._dirty = set()
+        if changed:
+            self.dataChanged.emit(self.index(min(changed), 0), self.index(max(changed), len(self.COLUMNS) - 1))
+
+    def remove_rows(self, indices):
+        # Rows with a job or input still in flight stay, so updates have a home.
+        removable = sorted((index for index in set(indices) if self._removable(self.rows[index])), reverse=True)
+        for _, run in itertools.groupby(enumerate(removable), key=lambda item: item[0] + item[1]):
+            run = [index for _, index in run]
+            self.beginRemoveRows(QModelIndex(), run[-1], run[0])
+            del self.rows[run[-1]:run[0] + 1]
+            self.endRemoveRows()
+        if removable:
+            self._reindex()
+        return len(removable)
+
+    def _removable(self, row):
+        # Submitted rows stay until their input is reported, since inputs are
+        # matched to rows by position.
+        if row.state == self.SUBMITTED:
+            return False
+        return row.job is None or row.state in FINISHED_STATES
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self._reindex()
+        self.endResetModel()
+
+    def _reindex(self):
+        self._rows_by_url = {}
+        self._rows_by_job = {}
+        self._rows_by_input = {}
+        self._waiting = {}
+        self._active = set()
+        self._dirty = set()
+        for index, row in enumerate(self.rows):
+            self._rows_by_url.setdefault(row.url, []).append(index)
+            if row.job is not None:
+                self._rows_by_job[row.job.id] = index
+            if row.input is not None:
+                self._rows_by_input[row.input] = index
+            if row.state == self.SUBMITTED and row.input is None:
+                self._waiting.setdefault(row.batch, collections.deque()).append(index)
+            elif row.job is not None and row.state not in FINISHED_STATES:
+                self._active.add(index)
+
+class ProgressDelegate(QStyledItemDelegate):
+    def paint(self, painter, option, index):
+        progress = index.data(Qt.UserRole)
+        if progress is None:
+            super().paint(painter, option, index)
+            return
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(2, 2, -2, -2)
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = progress
+        bar.text = index.data(Qt.DisplayRole)
+        bar.textVisible = True
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
+
+class UrlConversionWidget(QWidget):
+    def __init__(self):
+        super().__init__()
+
+        self.scheduler = None
+        self.job_states = {}
+        self.job_signals = JobSignals()
+        self.job_signals.state_changed.connect(self.on_job_state_changed)
+        self.job_signals.metrics_recorded.connect(self.on_metrics_recorded)
+        self.job_metrics = []
+
+        self.queue_model = UrlQueueModel()
+        self.job_signals.job_updated.connect(self.queue_model.update_job)
+        self.job_signals.input_expanded.connect(self.queue_model.input_expanded)
+        self.queue_timer = QTimer(self)
+        self.queue_timer.timeout.connect(self.queue_model.flush)
+        self.queue_timer.start(QUEUE_REFRESH_INTERVAL_MS)
+
+        self.metadata_generation = 0
+        self.metadata_signals = MetadataSignals()
+        self.metadata_signals.resolved.connect(self.on_metadata_resolved)
+        self.metadata_signals.finished.connect(self.on_metadata_finished)
+
+        self.layout = QVBoxLayout()
+
+        url_label = QLabel("Enter YouTube URLs:")
+        self.layout.addWidget(url_label)
+
+        self.url_entry = QLineEdit()
+        self.url_entry.returnPressed.connect(self.add_entered_urls)
+        self.layout.addWidget(self.url_entry)
+
+        queue_buttons = QHBoxLayout()
+        for text, slot in (("Add", self.add_entered_urls), ("Paste", self.paste_urls), ("Import...", self.import_urls),
+                           ("Remove Selected", self.remove_selected), ("Clear", self.clear_queue)):
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            queue_buttons.addWidget(button)
+        self.layout.addLayout(queue_buttons)
+
+        self.queue_view = QTableView()
+        self.queue_view.setModel(self.queue_model)
+        self.queue_view.setItemDelegateForColumn(UrlQueueModel.PROGRESS, ProgressDelegate(self.queue_view))
+        self.queue_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_view.setWordWrap(False)
+        # Fixed row heights and column widths keep the view from measuring
+        # every row, so scrolling a 10,000-row queue stays cheap.
+        self.queue_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.queue_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.queue_view.horizontalHeader().setStretchLastSection(True)
+        self.queue_view.setColumnWidth(UrlQueueModel.URL, 260)
+        self.queue_view.setColumnWidth(UrlQueueModel.TITLE, 220)
+        paste_shortcut = QShortcut(QKeySequence.Paste, self.queue_view)
+        paste_shortcut.setContext(Qt.WidgetShortcut)
+        paste_shortcut.activated.connect(self.paste_urls)
+        self.layout.addWidget(self.queue_view)
+
+        self.parse_button = QPushButton("Parse")
+        self.parse_button.clicked.connect(self.parse_urls_metadata)
+        self.layout.addWidget(self.parse_button)
+
+        self.download_all_button = QPushButton("Download All")
+
+        self.download_all_button.clicked.connect(self.download_all)
+        self.layout.addWidget(self.download_all_button)
+
+        self.download_selected_button = QPushButton("Download Selected")
+        self.download_selected_button.clicked.connect(self.download_selected)
+        self.layout.addWidget(self.download_selected_button)
+
+        self.download_all_button.setEnabled(False)
+        self.download_selected_button.setEnabled(False)
+        for signal in (self.queue_model.rowsInserted, self.queue_model.rowsRemoved, self.queue_model.modelReset):
+            signal.connect(self.update_queue_buttons)
+
+        cancel_button = QPushButton("Cancel All")
+        cancel_button.clicked.connect(self.cancel_all)
+        self.layout.addWidget(cancel_button)
+
+        resume_button = QPushButton("Resume Unfinished")
+        resume_button.clicked.connect(self.resume_unfinished)
+        self.layout.addWidget(resume_button)
+
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset_defaults)
+        self.layout.addWidget(reset_button)
+
+        self.parsed_info_browser = QTextBrowser()
+        self.parsed_info_browser.setStyleSheet("background-color: black; color: lightgreen;")
+        self.layout.addWidget(self.parsed_info_browser)
+
+        self.layout.addSpacing(10)
+
+        library_label = QLabel("Select Library Source:")
+        self.library_combo_box = QComboBox()
+        self.library_combo_box.addItems(['pytube', 'youtube_dl', 'yt_dlp'])
+        self.library_combo_box.currentIndexChanged.connect(self.handle_library_change)
+        self.layout.addWidget(library_label)
+        self.layout.addWidget(self.library_combo_box)
+
+        format_label = QLabel("Select Audio Format:")
+        self.layout.addWidget(format_label)
+
+        self.format_combo_box = QComboBox()
+        self.format_combo_box.addItems(['aac', 'mp3', 'flac', 'wav', 'opus'])
+        self.format_combo_box.currentIndexChanged.connect(self.handle_format_change)
+        self.layout.addWidget(format_label)
+        self.layout.addWidget(self.format_combo_box)
+        
+        bitrate_label = QLabel("Select Bitrate:")
+        self.layout.addWidget(bitrate_label)
+
+        self.bitrate_combo_box = QComboBox()
+        self.bitrate_combo_box.addItems(BITRATES)
+        self.layout.addWidget(self.bitrate_combo_box)
+
+        bit_depth_label = QLabel("Select Bit Depth:")
+        self.layout.addWidget(bit_depth_label)
+
+        self.bit_depth_combo_box = QComboBox()
+        self.bit_depth_combo_box.addItems(['16-bit', '24-bit', '32-bit'])
+        self.layout.addWidget(self.bit_depth_combo_box)
+
+        sampling_rate_label = QLabel("Select Sampling Rate:")
+        self.layout.addWidget(sampling_rate_label)
+
+        self.sampling_rate_combo_box = QComboBox()
+        self.sampling_rate_combo_box.addItems(['44100', '48000', '88200', '96000', '176400', '192000'])
+        self.layout.addWidget(self.sampling_rate_combo_box)
+
+        conversion_method_label = QLabel("Select Conversion Method:")
+        self.layout.addWidget(conversion_method_label)
+
+        self.conversion_method_combo_box = QComboBox()
+        self.conversion_method_combo_box.addItems(['Default', 'ffmpeg', 'pydub', 'chunked'])
+        self.conversion_method_combo_box.currentIndexChanged.connect(self.handle_conversion_change)
+        self.layout.addWidget(self.conversion_method_combo_box)
+        
+        extra_targets_label = QLabel("Additional Outputs (e.g. flac, mp3:192k:44100):")
+        self.layout.addWidget(extra_targets_label)
+
+        self.extra_targets_entry = QLineEdit()
+        self.layout.addWidget(self.extra_targets_entry)
+
+        self.streaming_check_box = QCheckBox("Stream into ffmpeg without temporary files")
+        self.layout.addWidget(self.streaming_check_box)
+
+        self.segmented_check_box = QCheckBox("Encode long tracks in parallel segments")
+        self.layout.addWidget(self.segmented_check_box)
+
+        self.normalize_check_box = QCheckBox(f"Normalize loudness to {DEFAULT_LOUDNESS_TARGET:g} LUFS (EBU R128)")
+        self.layout.addWidget(self.normalize_check_box)
+
+        self.trim_silence_check_box = QCheckBox("Trim leading and trailing silence")
+        self.layout.addWidget(self.trim_silence_check_box)
+
+        download_workers_label = QLabel("Parallel Downloads:")
+        self.layout.addWidget(download_workers_label)
+
+        self.download_workers_spin_box = QSpinBox()
+        self.download_workers_spin_box.setRange(1, 64)
+        self.download_workers_spin_box.setValue(DEFAULT_DOWNLOAD_WORKERS)
+        self.layout.addWidget(self.download_workers_spin_box)
+
+        transcode_workers_label = QLabel("Parallel Conversions:")
+        self.layout.addWidget(transcode_workers_label)
+
+        self.transcode_workers_spin_box = QSpinBox()
+        self.transcode_workers_spin_box.setRange(1, DEFAULT_TRANSCODE_WORKERS * 4)
+        self.transcode_workers_spin_box.setValue(DEFAULT_TRANSCODE_WORKERS)
+        self.layout.addWidget(self.transcode_workers_spin_box)
+
+        bandwidth_cap_label = QLabel("Bandwidth Cap (MB/s, 0 = unlimited):")
+        self.layout.addWidget(bandwidth_cap_label)
+
+        self.bandwidth_cap_spin_box = QSpinBox()
+        self.bandwidth_cap_spin_box.setRange(0, 1000)
+        self.layout.addWidget(self.bandwidth_cap_spin_box)
+
+        folder_label = QLabel("Select Output Folder:")
+        self.layout.addWidget(folder_label)
+
+        self.folder_entry = QLineEdit()
+        self.layout.addWidget(self.folder_entry)
+
+        browse_button = QPushButton("Browse")
+        browse_button.clicked.connect(self.browse_folder_path)
+        self.layout.addWidget(browse_button)
+
+        library_info_label = QLabel("Library Information:\n"
+                                    "- pytube: Simple library for downloading YouTube videos. Supports MP3, AAC, FLAC, WAV and Opus.\n"
+                                    "- youtube_dl: Robust library for downloading YouTube videos with many options. "
+                                    "Supports MP3, AAC, FLAC and WAV formats.\n"
+                                    "- yt_dlp: Improved version of youtube_dl with additional features and improvements. "
+                                    "Supports MP3, AAC, FLAC, WAV and Opus formats.")
+        self.layout.addWidget(library_info_label)
+
+        self.conversion_status_label = QLabel("Conversion Status: Idle")
+        self.layout.addWidget(self.conversion_status_label)
+
+        self.stats_label = QLabel("Stats: No completed jobs")
+        self.layout.addWidget(self.stats_label)
+
+        self.setLayout(self.layout)
+    
+    def add_entered_urls(self):
+        self.add_urls(self.url_entry.text().split())
+        self.url_entry.clear()
+
+    def paste_urls(self):
+        self.add_urls(read_url_lines(QApplication.clipboard().text()))
+
+    def import_urls(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import URLs", "", "Text files (*.txt);;All files (*)")
+        if not path:
+            return
+        try:
+            with open(path, encoding='utf-8') as url_file:
+                added = self.add_urls(read_url_lines(url_file.read()))
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Could not import URLs from {path}: {e}")
+            return
+        print(f"Imported {added} URLs from {path}.")
+
+    def add_urls(self, urls):
+        added = self.queue_model.add_urls(urls)
+        if added:
+            self.queue_view.scrollToBottom()
+        return added
+
+    def selected_rows(self):
+        return sorted(index.row() for index in self.queue_view.selectionModel().selectedRows())
+
+    def remove_selected(self):
+        self.queue_model.remove_rows(self.selected_rows())
+
+    def clear_queue(self):
+        self.queue_model.clear()
+
+    def update_queue_buttons(self):
+        has_rows = self.queue_model.rowCount() > 0
+        self.download_all_button.setEnabled(has_rows)
+        self.download_selected_button.setEnabled(has_rows)
+
+    def download_all(self):
+        self.submit_rows(self.queue_model.submittable_rows())
+
+    def download_selected(self):
+        self.submit_rows(self.queue_model.submittable_rows(self.selected_rows()))
+
+    def submit_rows(self, rows):
+        # Signals from the batch are queued behind this call, so its rows are
+        # waiting before the first input is reported.
+        batch = self.submit_urls(self.queue_model.urls(rows)) if rows else None
+        if batch is not None:
+            self.queue_model.mark_submitted(rows, batch)
+
+    def cancel_all(self):
+        if self.scheduler is not None:
+            self.scheduler.cancel_all()
+            self.conversion_status_label.setText("Conversion Status: Cancelling...")
+
+    def get_scheduler(self):
+        download_workers = self.download_workers_spin_box.value()
+        transcode_workers = self.transcode_workers_spin_box.value()
+        configure_bandwidth(download_workers, self.bandwidth_cap_spin_box.value() * 1000 * 1000 or None)
+
+        scheduler = self.scheduler
+        if scheduler is not None:
+            limits = (scheduler.download_workers, scheduler.transcode_workers)
+            if limits == (download_workers, transcode_workers) or not scheduler.is_idle():
+                return scheduler
+            scheduler.shutdown(wait=False)
+
+        self.scheduler = create_scheduler(download_workers, transcode_workers, self.job_signals.emit_job)
+        return self.scheduler
+    
+    def reset_defaults(self):
+        self.url_entry.clear()
+        self.queue_model.clear()
+
+        self.library_combo_box.setCurrentIndex(0)
+        self.handle_library_change()
+        self.format_combo_box.setCurrentIndex(0)
+        self.handle_format_change()
+        self.bitrate_combo_box.setCurrentIndex(0)
+        self.sampling_rate_combo_box.setCurrentIndex(0)
+        self.bit_depth_combo_box.setCurrentIndex(0)
+        self.conversion_method_combo_box.setCurrentIndex(0)
+        self.download_workers_spin_box.setValue(DEFAULT_DOWNLOAD_WORKERS)
+        self.transcode_workers_spin_box.setValue(DEFAULT_TRANSCODE_WORKERS)
+        self.bandwidth_cap_spin_box.setValue(0)
+        self.streaming_check_box.setChecked(False)
+        self.segmented_check_box.setChecked(False)
+        self.normalize_check_box.setChecked(False)
+        self.trim_silence_check_box.setChecked(False)
+        self.extra_targets_entry.clear()
+        self.folder_entry.clear()
+        self.metadata_generation += 1
+        self.parse_button.setEnabled(True)
+        self.parsed_info_browser.clear()
+        self.conversion_status_label.setText("Conversion Status: Idle")
+
+    def parse_urls_metadata(self):
+        urls = self.queue_model.urls()
+        library_source = self.library_combo_box.currentText()
+
+        self.metadata_generation += 1
+        generation = self.metadata_generation
+        self.parsed_info_browser.clear()
+        self.parse_button.setEnabled(False)
+
+        def fetch(url):
+            return fetch_metadata(url, library_source, get_session_pool())
+
+        def run():
+            try:
+                for url, video_details, error in resolve_all(urls, fetch, get_metadata_cache()):
+                    self.metadata_signals.resolved.emit(generation, url, video_details, str(error) if error else '')
+            finally:
+                self.metadata_signals.finished.emit(generation)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def on_metadata_resolved(self, generation, url, video_details, error):
+        if generation != self.metadata_generation:
+            return
+        if error:
+            self.parsed_info_browser.append(f"Error fetching metadata for {url}: {error}\n")
+        else:
+            self.queue_model.set_metadata(url, video_details['title'], video_details['author'])
+
+    def on_metadata_finished(self, generation):
+        if generation == self.metadata_generation:
+            self.parse_button.setEnabled(True)
+
+    def handle_library_change(self):
+        library_source = self.library_combo_box.currentText()
+
+        disable_bitrate_sampling_bitdepth = library_source in ['flac', 'wav']
+        self.bitrate_combo_box.setEnabled(not disable_bitrate_sampling_bitdepth)
+        self.sampling_rate_combo_box.setEnabled(not disable_bitrate_sampling_bitdepth)
+        self.bit_depth_combo_box.setEnabled(not disable_bitrate_sampling_bitdepth)
+
+        if library_source == 'youtube_dl':
+            self.format_combo_box.clear()
+            self.format_combo_box.addItems(['aac', 'mp3'])
+        else:
+            self.format_combo_box.clear()
+            self.format_combo_box.addItems(['aac', 'mp3', 'flac', 'wav', 'opus'])
+
+        self.handle_format_change()
+
+    def browse_folder_path(self):
+        folder_selected = QFileDialog.getExistingDirectory(self, "Select Output Folder")
+        self.folder_entry.setText(folder_selected)
+
+    def submit_urls(self, urls):
+        # urls come from the queue model, which already sanitized them.
+        # Returns the key of the queued batch, or None if nothing was queued.
+        if not urls:
+            return None
+
+        self.conversion_status_label.setText(f"Conversion Status: Converting {', '.join(urls[:3])}{'...' if len(urls) > 3 else ''}")
+
+        try:
+            options = dict(output_dir=self.folder_entry.text(),
+                           format=self.format_combo_box.currentText(),
+                           bitrate=self.bitrate_combo_box.currentText(),
+                           sampling_rate=int(self.sampling_rate_combo_box.currentText()),
+                           bit_depth=self.bit_depth_combo_box.currentText(),
+                           conversion_method=self.conversion_method_combo_box.currentText(),
+                           library_source=self.library_combo_box.currentText(),
+                           streaming=self.streaming_check_box.isChecked(),
+                           segmented=self.segmented_check_box.isChecked(),
+                           normalize=DEFAULT_LOUDNESS_TARGET if self.normalize_check_box.isChecked() else None,
+                           trim_silence=self.trim_silence_check_box.isChecked(),
+                           extra_targets=self.extra_targets_entry.text())
+            parse_targets(options['extra_targets'])
+
+            return queue_batch(self.get_scheduler(), urls, on_input=self.job_signals.input_expanded.emit, **options)
+        except Exception as e:
+            error_message = f"An error occurred for {', '.join(urls[:3])}{'...' if len(urls) > 3 else ''}: {e}"
+            print(error_message)
+            self.conversion_status_label.setText(f"Conversion Status: Error - {str(e)}")
+            return None
+
+    def resume_unfinished(self):
+        output_dir = self.folder_entry.text() or 'output'
+        try:
+            jobs, batches = resume_batches(self.get_scheduler(), output_dir)
+        except Exception as e:
+            print(f"Could not resume jobs in {output_dir}: {e}")
+            self.conversion_status_label.setText(f"Conversion Status: Error - {str(e)}")
+            return
+        if jobs or batches:
+            print(f"Resuming {jobs} unfinished jobs and {batches} unfinished batches from {output_dir}.")
+        else:
+            self.conversion_status_label.setText("Conversion Status: Nothing to resume")
+
+    def download_and_convert(self, youtube_url, output_dir, audio_format, bitrate, sampling_rate, bit_depth, conversion_method, library_source):
+        worker = DownloadWorker(youtube_url, output_dir, audio_format, bitrate, sampling_rate, bit_depth, conversion_method, library_source)
+        worker.finished.connect(self.on_conversion_finished)
+        worker.error.connect(self.on_conversion_error)
+        worker.download_and_convert()
+
+    def on_job_state_changed(self, job_id, url, state, error):
+        if state in FINISHED_STATES:
+            self.job_states.pop(job_id, None)
+        else:
+            self.job_states[job_id] = state
+
+        if error:
+            print(f"An error occurred for {url}: {error}")
+        elif state == 'done':
+            print(f"Conversion for {url} completed successfully.")
+        elif state == 'skipped':
+            print(f"Skipped {url}: its outputs already exist.")
+
+        if self.job_states:
+            counts = {}
+            for job_state in self.job_states.values():
+                counts[job_state] = counts.get(job_state, 0) + 1
+            summary = ", ".join(f"{count} {job_state}" for job_state, count in sorted(counts.items()))
+            self.conversion_status_label.setText(f"Conversion Status: {summary}")
+        elif error:
+            self.conversion_status_label.setText(f"Conversion Status: Error - {error}")
+        else:
+            self.conversion_status_label.setText(f"Conversion Status: {state.capitalize()} {url}")
+
+    def on_metrics_recorded(self, record):
+        if record['state'] != 'done':
+            return
+        self.job_metrics.append(record)
+
+        def average(values):
+            values = [value for value in values if value is not None]
+            return sum(values) / len(values) if values else None
+
+        parts = [f"{len(self.job_metrics)} jobs"]
+        download_mbps = average(metrics['download_mbps'] for metrics in self.job_metrics)
+        if download_mbps is not None:
+            parts.append(f"{download_mbps:.2f} MB/s")
+        realtime_factor = average(metrics['realtime_factor'] for metrics in self.job_metrics)
+        if realtime_factor is not None:
+            parts.append(f"{realtime_factor:.1f}x realtime")
+        stage_names = sorted({name for metrics in self.job_metrics for name in metrics['stages']})
+        for name in stage_names:
+            seconds = average(metrics['stages'].get(name) for metrics in self.job_metrics)
+            parts.append(f"{name} {seconds:.2f}s")
+        self.stats_label.setText("Stats: " + ", ".join(parts))
+
+    def on_conversion_finished(self, message):
+        self.conversion_status_label.setText(f"Conversion Status: {message}")
+
+    def on_conversion_error(self, error_message):
+        self.conversion_status_label.setText(f"Conversion Status: Error - {error_message}")
+
+    def handle_format_change(self):
+        audio_format = self.format_combo_box.currentText()
+
+        disable_bitrate_sampling_bitdepth = audio_format in ['flac', 'wav']
+        self.bitrate_combo_box.setEnabled(not disable_bitrate_sampling_bitdepth)
+        self.sampling_rate_combo_box.setEnabled(not disable_bitrate_sampling_bitdepth)
+        self.bit_depth_combo_box.setEnabled(not disable_bitrate_sampling_bitdepth)
+
+        selected_bitrate = self.bitrate_combo_box.currentText()
+        self.bitrate_combo_box.clear()
+        self.bitrate_combo_box.addItems(OPUS_BITRATES if audio_format == 'opus' else BITRATES)
+        self.bitrate_combo_box.setCurrentText(selected_bitrate)
+
+        if audio_format == 'aac':
+            self.sampling_rate_combo_box.clear()
+            self.sampling_rate_combo_box.addItems(['44100', '48000', '88200', '96000'])
+        elif audio_format == 'mp3':
+            self.sampling_rate_combo_box.clear()
+            self.sampling_rate_combo_box.addItems(['44100', '48000'])
+        elif audio_format == 'opus':
+            self.sampling_rate_combo_box.clear()
+            self.sampling_rate_combo_box.addItems(['48000'])
+        else:
+            self.sampling_rate_combo_box.clear()
+            self.sampling_rate_combo_box.addItems(['44100', '48000', '88200', '96000', '176400', '192000'])
+
+        selected_sampling_rate = int(self.sampling_rate_combo_box.currentText())
+        if audio_format == 'aac' and selected_sampling_rate > 96000:
+            self.sampling_rate_combo_box.setCurrentText('96000')
+        elif audio_format == 'mp3' and selected_sampling_rate > 48000:
+            self.sampling_rate_combo_box.setCurrentText('48000')
+
+    def handle_conversion_change(self):
+        conversion_method = self.conversion_method_combo_box.currentText()
+
+        hide_bitrate_sampling_bitdepth = conversion_method == 'Default'
+        self.bitrate_combo_box.setEnabled(not hide_bitrate_sampling_bitdepth)
+        self.sampling_rate_combo_box.setEnabled(not hide_bitrate_sampling_bitdepth)
+        self.bit_depth_combo_box.setEnabled(not hide_bitrate_sampling_bitdepth)
+
+        self.streaming_check_box.setEnabled(conversion_method not in PCM_METHODS)
+        self.segmented_check_box.setEnabled(conversion_method not in PCM_METHODS)
+
+class MainWindow(QMainWindow):
+    def __init__(self):
+        super().__init__()
+
+        self.setWindowTitle("Audiophile")
+        self.setGeometry(100, 100, 800, 500)
+        self.setStyleSheet("background-color: lightgray;")
+
+        main_widget = QWidget()
+        self.setCentralWidget(main_widget)
+
+        layout = QHBoxLayout()
+
+        self.console = Console()
+        layout.addWidget(self.console, 1) 
+
+        url_conversion_widget = UrlConversionWidget()
+        layout.addWidget(url_conversion_widget, 2) 
+
+        main_widget.setLayout(layout)
+
+        self.log_sink = LogSink(log_path=default_log_path())
+        sys.stdout = self.log_sink.stream(OUT)
+        sys.stderr = self.log_sink.stream(ERR)
+
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(LOG_FLUSH_INTERVAL_MS)
+
+    def flush_log(self):
+        lines, dropped = self.log_sink.drain()
+        if lines or dropped:
+            self.console.append_lines(lines, dropped)
+
+    def close_log(self):
+        self.log_timer.stop()
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        self.log_sink.close()
+
+def main():
+    app = QApplication(sys.argv)
+    app.aboutToQuit.connect(close_journals)
+    app.aboutToQuit.connect(close_manifests)
+    app.aboutToQuit.connect(lambda: get_transcode_engine().shutdown(wait=False))
+    app.aboutToQuit.connect(lambda: get_session_pool().close())
+    window = MainWindow()
+    app.aboutToQuit.connect(window.close_log)
+    window.show()
+    sys.exit(app.exec_())
@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metadata import video_id
+from scheduler import FINISHED_STATES
+
+JOURNAL_FILE = '.audiophile-journal.sqlite3'
+
+
+class JobJournal:
+    # Durable record of every batch queued into one output folder: the batch
+    # options and input URLs, each job expanded from them and every state the
+    # job passed through. A batch is only marked finished once all of its jobs
+    # were queued, so a crash mid-expansion can be picked up where it stopped.
+    def __init__(self, path):
+        self.path = path
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._rows = {}
+        self._feeding = set()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "id INTEGER PRIMARY KEY, options TEXT NOT NULL, created_at REAL NOT NULL, queued INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS inputs ("
+                "id INTEGER PRIMARY KEY, batch_id INTEGER NOT NULL REFERENCES batches (id), url TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY, batch_id INTEGER NOT NULL REFERENCES batches (id), url TEXT NOT NULL, "
+                "video_id TEXT NOT NULL, state TEXT NOT NULL, error TEXT, updated_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS transitions ("
+                "job_id INTEGER NOT NULL REFERENCES jobs (id), state TEXT NOT NULL, error TEXT, at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id, video_id)")
+
+    def start_batch(self, options):
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO batches (options, created_at) VALUES (?, ?)", (json.dumps(options), time.time())
+            )
+            self._feeding.add(cursor.lastrowid)
+        return cursor.lastrowid
+
+    def add_input(self, batch_id, url):
+        with self._lock, self._connection:
+            cursor = self._connection.execute("INSERT INTO inputs (batch_id, url) VALUES (?, ?)", (batch_id, url))
+        return cursor.lastrowid
+
+    def release_batch(self, batch_id):
+        # A batch whose feed was stopped while the journal is still open was
+        # cancelled on purpose and is not resumed. Closing the journal first
+        # (or crashing) leaves it open for the next run.
+        with self._lock:
+            if self._closed:
+                return
+            self._feeding.discard(batch_id)
+            for job_id, (job_batch_id, row_id) in list(self._rows.items()):
+                if job_batch_id == batch_id and row_id is None:
+                    del self._rows[job_id]
+            with self._connection:
+                self._connection.execute("UPDATE batches SET queued = 1 WHERE id = ?", (batch_id,))
+
+    def attach(self, job, batch_id, row_id=None):
+        # Jobs get their row when the scheduler first reports them, so a job
+        # built but never submitted is simply expanded again on resume.
+        with self._lock:
+            self._rows[job.id] = (batch_id, row_id)
+
+    def record(self, job):
+        now = time.time()
+        error = str(job.error) if job.error is not None else None
+        with self._lock:
+            if self._closed or job.id not in self._rows:
+                return
+            batch_id, row_id = self._rows[job.id]
+            with self._connection:
+                if row_id is None:
+                    cursor = self._connection.execute(
+                        "INSERT INTO jobs (batch_id, url, video_id, state, error, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (batch_id, job.url, video_id(job.url), job.state, error, now)
+                    )
+                    row_id = cursor.lastrowid
+                else:
+                    self._connection.execute(
+                        "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?", (job.state, error, now, row_id)
+                    )
+                self._connection.execute(
+                    "INSERT INTO transitions (job_id, state, error, at) VALUES (?, ?, ?, ?)", (row_id, job.state, error, now)
+                )
+            if job.state in FINISHED_STATES:
+                del self._rows[job.id]
+            else:
+                self._rows[job.id] = (batch_id, row_id)
+
+    def unfinished_jobs(self):
+        placeholders = ', '.join('?' for _ in FINISHED_STATES)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT jobs.id, jobs.batch_id, jobs.url, batches.options FROM jobs JOIN batches ON batches.id = jobs.batch_id "
+                f"WHERE jobs.state NOT IN ({placeholders}) ORDER BY jobs.id", FINISHED_STATES
+            ).fetchall()
+            running = {row_id for _, row_id in self._rows.values()}
+        return [(row_id, batch_id, url, json.loads(options)) for row_id, batch_id, url, options in rows if row_id not in running]
+
+    def claim_open_batches(self):
+        with self._lock:
+            batches = self._connection.execute("SELECT id, options FROM batches WHERE queued = 0 ORDER BY id").fetchall()
+            result = []
+            for batch_id, options in batches:
+                if batch_id in self._feeding:
+                    continue
+                self._feeding.add(batch_id)
+                inputs = self._connection.execute(
+                    "SELECT id, url FROM inputs WHERE batch_id = ? ORDER BY id", (batch_id,)).fetchall()
+                known = {row[0] for row in self._connection.execute(
+                    "SELECT video_id FROM jobs WHERE batch_id = ?", (batch_id,))}
+                result.append((batch_id, json.loads(options), inputs, known))
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._rows.clear()
+            self._connection.close()
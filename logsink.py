@@ -0,0 +1,131 @@
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+from metadata import default_cache_path
+
+OUT = 'out'
+ERR = 'err'
+
+DEFAULT_MAX_LINES = 5000
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+_LEVELS = {OUT: logging.INFO, ERR: logging.ERROR}
+
+
+def default_log_path():
+    return os.path.join(os.path.dirname(default_cache_path()), 'audiophile.log')
+
+
+def _last_segment(line):
+    # Progress output redraws itself with carriage returns; only the final
+    # state of such a line is worth keeping.
+    return line.rstrip('\r').rsplit('\r', 1)[-1]
+
+
+class LogStream:
+    def __init__(self, sink, channel):
+        self.sink = sink
+        self.channel = channel
+
+    def write(self, text):
+        text = str(text)
+        self.sink.write(self.channel, text)
+        return len(text)
+
+    def flush(self):
+        self.sink.flush_thread(self.channel)
+
+    def isatty(self):
+        return False
+
+
+class LogSink:
+    # Writers only touch their own thread's partial line and a bounded deque of
+    # finished lines; the GUI drains the deque on a timer, so a burst of output
+    # costs one repaint per tick instead of one queued signal per write(). The
+    # full log goes to a rotating file through a background listener thread.
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, log_path=None, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.max_lines = max_lines
+        self.dropped = 0
+        self._pending = collections.deque(maxlen=max_lines)
+        self._partial = {}
+        self._lock = threading.Lock()
+        self._logger = None
+        self._listener = None
+        if log_path:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(threadName)s %(levelname)s %(message)s'))
+            records = queue.Queue()
+            self._listener = logging.handlers.QueueListener(records, handler)
+            self._listener.start()
+            self._logger = logging.getLogger('audiophile.console')
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.handlers = [logging.handlers.QueueHandler(records)]
+
+    def stream(self, channel=OUT):
+        return LogStream(self, channel)
+
+    def write(self, channel, text):
+        key = (threading.get_ident(), channel)
+        with self._lock:
+            text = self._partial.pop(key, '') + text
+            *lines, rest = text.split('\n')
+            if '\r' in rest[:-1]:
+                rest = rest[rest.rindex('\r', 0, len(rest) - 1) + 1:]
+            if rest:
+                self._partial[key] = rest
+            lines = [_last_segment(line) for line in lines]
+            self._push(channel, lines)
+        self._log(channel, lines)
+
+    def flush_thread(self, channel=OUT):
+        self._flush_partial((threading.get_ident(), channel))
+
+    def flush_all(self):
+        with self._lock:
+            keys = list(self._partial)
+        for key in keys:
+            self._flush_partial(key)
+
+    def _flush_partial(self, key):
+        with self._lock:
+            rest = self._partial.pop(key, None)
+            if rest is None:
+                return
+            lines = [_last_segment(rest)]
+            self._push(key[1], lines)
+        self._log(key[1], lines)
+
+    def _push(self, channel, lines):
+        overflow = len(self._pending) + len(lines) - self.max_lines
+        if overflow > 0:
+            self.dropped += overflow
+        self._pending.extend((channel, line) for line in lines)
+
+    def _log(self, channel, lines):
+        if self._logger is None:
+            return
+        for line in lines:
+            self._logger.log(_LEVELS[channel], line)
+
+    def drain(self):
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        return lines, dropped
+
+    def close(self):
+        self.flush_all()
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            self._logger.handlers = []
+            self._logger = None
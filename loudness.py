@@ -0,0 +1,251 @@
+import json
+import math
+import os
+from collections import namedtuple
+
+import ffmpeg
+import numpy as np
+
+from chunked import _read_into, _start, _wait
+from transcoder import CHUNK_FRAMES
+
+# Measurements follow ITU-R BS.1770-4 / EBU R128 on a stereo mix at 48 kHz,
+# where every channel weight is 1.
+ANALYSIS_RATE = 48000
+CHANNELS = 2
+TARGET_LOUDNESS = -14.0
+TRUE_PEAK_CEILING = -1.0
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+STEP_SECONDS = 0.1
+STEPS_PER_BLOCK = 4
+SILENCE_THRESHOLD = -60.0
+TRIM_PADDING = 0.1
+SIDECAR_SUFFIX = '.loudness.json'
+SIDECAR_VERSION = 1
+
+# 4x oversampling interpolation filter from BS.1770-4 Annex 2, one row per
+# phase.
+TRUE_PEAK_PHASES = (
+    (0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000, -0.0594482421875, 0.1373291015625,
+     0.9721679687500, -0.1022949218750, 0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500),
+    (-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250, -0.1665039062500, 0.4650878906250,
+     0.7797851562500, -0.2003173828125, 0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375),
+    (-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000, -0.2003173828125, 0.7797851562500,
+     0.4650878906250, -0.1665039062500, 0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875),
+    (-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750, -0.1022949218750, 0.9721679687500,
+     0.1373291015625, -0.0594482421875, 0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750),
+)
+
+Loudness = namedtuple('Loudness', ['integrated', 'true_peak', 'trim_start', 'trim_end', 'duration'])
+
+
+def k_weighting(sample_rate):
+    # Coefficients of the BS.1770 pre-filter (high shelf) and RLB high-pass
+    # for any sample rate; at 48 kHz they match the tables in the standard.
+    gain, q, frequency = 3.99984385397, 0.7071752369554193, 1681.974450955533
+    k = math.tan(math.pi * frequency / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.499666774155
+    a0 = 1 + k / q + k * k
+    shelf = {'b0': (vh + vb * k / q + k * k) / a0, 'b1': 2 * (k * k - vh) / a0, 'b2': (vh - vb * k / q + k * k) / a0,
+             'a0': 1.0, 'a1': 2 * (k * k - 1) / a0, 'a2': (1 - k / q + k * k) / a0}
+
+    q, frequency = 0.5003270373238773, 38.13547087602444
+    k = math.tan(math.pi * frequency / sample_rate)
+    a0 = 1 + k / q + k * k
+    high_pass = {'b0': 1.0, 'b1': -2.0, 'b2': 1.0, 'a0': 1.0, 'a1': 2 * (k * k - 1) / a0, 'a2': (1 - k / q + k * k) / a0}
+    return shelf, high_pass
+
+
+class LoudnessMeter:
+    # Consumes PCM chunk by chunk and keeps only one sum of squares per
+    # channel and 100 ms step, an 11-sample filter history and two sample
+    # positions, so memory stays flat however long the track is. The K
+    # weighting itself is recursive and runs in the decoding ffmpeg; all the
+    # per-sample work here is vectorized.
+    def __init__(self, sample_rate=ANALYSIS_RATE, channels=CHANNELS):
+        self.sample_rate = sample_rate
+        self.step = int(sample_rate * STEP_SECONDS)
+        self._steps = []
+        self._partial = np.zeros(channels)
+        self._partial_count = 0
+        self._phases = np.array(TRUE_PEAK_PHASES, dtype=np.float32)[:, ::-1].T.copy()
+        self._history = np.zeros((self._phases.shape[0] - 1, channels), dtype=np.float32)
+        self._peak = 0.0
+        self._silence = 10 ** (SILENCE_THRESHOLD / 20)
+        self._first_sound = None
+        self._last_sound = None
+        self._frames = 0
+
+    def add(self, samples, weighted):
+        self._add_power(weighted)
+        self._add_peak(samples)
+        audible = np.flatnonzero((np.abs(samples) > self._silence).any(axis=1))
+        if audible.size:
+            if self._first_sound is None:
+                self._first_sound = self._frames + int(audible[0])
+            self._last_sound = self._frames + int(audible[-1])
+        self._frames += len(samples)
+
+    def _add_power(self, weighted):
+        squares = np.square(weighted, dtype=np.float64)
+        if self._partial_count:
+            head, squares = squares[:self.step - self._partial_count], squares[self.step - self._partial_count:]
+            self._partial += head.sum(axis=0)
+            self._partial_count += len(head)
+            if self._partial_count < self.step:
+                return
+            self._steps.append(self._partial[np.newaxis])
+            self._partial = np.zeros_like(self._partial)
+            self._partial_count = 0
+        whole = len(squares) // self.step * self.step
+        if whole:
+            self._steps.append(squares[:whole].reshape(-1, self.step, squares.shape[1]).sum(axis=1))
+        if whole < len(squares):
+            self._partial += squares[whole:].sum(axis=0)
+            self._partial_count = len(squares) - whole
+
+    def _add_peak(self, samples):
+        padded = np.concatenate((self._history, samples))
+        self._history = padded[len(padded) - len(self._history):]
+        windows = np.lib.stride_tricks.sliding_window_view(padded, len(self._phases), axis=0)
+        peak = max(float(np.abs(windows @ self._phases).max(initial=0.0)), float(np.abs(samples).max(initial=0.0)))
+        self._peak = max(self._peak, peak)
+
+    def integrated(self):
+        # Gated mean over overlapping 400 ms blocks: an absolute gate at
+        # -70 LUFS, then a relative gate 10 LU below the absolute-gated level.
+        steps = np.concatenate(self._steps) if self._steps else np.zeros((0, len(self._partial)))
+        count = len(steps) - STEPS_PER_BLOCK + 1
+        if count <= 0:
+            return None
+        blocks = sum(steps[offset:offset + count] for offset in range(STEPS_PER_BLOCK))
+        power = blocks.sum(axis=1) / (STEPS_PER_BLOCK * self.step)
+        with np.errstate(divide='ignore'):
+            levels = -0.691 + 10 * np.log10(power)
+        gated = levels > ABSOLUTE_GATE
+        if not gated.any():
+            return None
+        relative = -0.691 + 10 * math.log10(power[gated].mean()) + RELATIVE_GATE
+        gated &= levels > relative
+        return -0.691 + 10 * math.log10(power[gated].mean())
+
+    def result(self):
+        true_peak = 20 * math.log10(self._peak) if self._peak > 0 else None
+        trim_start = trim_end = None
+        if self._first_sound is not None:
+            trim_start = self._first_sound / self.sample_rate
+            trim_end = (self._last_sound + 1) / self.sample_rate
+        return Loudness(self.integrated(), true_peak, trim_start, trim_end, self._frames / self.sample_rate)
+
+
+def analyze(audio_file, ffmpeg_path='ffmpeg', chunk_frames=CHUNK_FRAMES):
+    # A single decode feeds the meter: ffmpeg resamples to 48 kHz stereo,
+    # splits the signal and K-weights one copy, then interleaves both as four
+    # float channels on one pipe. biquad may negotiate a different sample
+    # format than its input, so both branches are pinned again before amerge.
+    shelf, high_pass = k_weighting(ANALYSIS_RATE)
+    audio = (
+        ffmpeg
+        .input(audio_file)
+        .audio
+        .filter('aresample', ANALYSIS_RATE)
+        .filter('aformat', sample_fmts='dbl', channel_layouts='stereo')
+        .filter_multi_output('asplit')
+    )
+    weighted = audio[1].filter('biquad', **shelf).filter('biquad', **high_pass)
+    branches = [stream.filter('aformat', sample_fmts='dbl', sample_rates=ANALYSIS_RATE, channel_layouts='stereo')
+                for stream in (audio[0], weighted)]
+    merged = ffmpeg.filter(branches, 'amerge', inputs=2)
+    decoder = _start(merged.output('pipe:1', f='f32le', acodec='pcm_f32le', ac=CHANNELS * 2), ffmpeg_path, pipe_stdout=True)
+
+    meter = LoudnessMeter()
+    buffer = np.empty((chunk_frames, CHANNELS * 2), dtype=np.float32)
+    view = memoryview(buffer).cast('B')
+    frame_bytes = buffer.itemsize * CHANNELS * 2
+    try:
+        while True:
+            filled = _read_into(decoder[0].stdout, view)
+            frames = filled // frame_bytes
+            if frames:
+                meter.add(buffer[:frames, :CHANNELS], buffer[:frames, CHANNELS:])
+            if filled < len(view):
+                break
+    except BaseException:
+        decoder[0].kill()
+        _wait(*decoder)
+        raise
+    returncode, message = _wait(*decoder)
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed while analyzing {audio_file}: status {returncode}: {message}")
+    return meter.result()
+
+
+def normalization_gain(loudness, target=TARGET_LOUDNESS, ceiling=TRUE_PEAK_CEILING):
+    # Gain in dB that brings the track to target, reduced where needed so
+    # its true peak stays below ceiling. None for silent tracks.
+    if loudness.integrated is None:
+        return None
+    gain = target - loudness.integrated
+    if loudness.true_peak is not None:
+        gain = min(gain, ceiling - loudness.true_peak)
+    return round(gain, 2)
+
+
+def trim_points(loudness, padding=TRIM_PADDING):
+    if loudness.trim_start is None:
+        return None
+    return max(0.0, loudness.trim_start - padding), min(loudness.duration, loudness.trim_end + padding)
+
+
+def sidecar_path(output_dir, name):
+    return os.path.join(output_dir, name + SIDECAR_SUFFIX)
+
+
+def load_measurements(path, source_size):
+    # Measurements are reused only for the same source file size, so a
+    # different stream of the same video is analyzed again.
+    try:
+        with open(path, encoding='utf-8') as sidecar:
+            record = json.load(sidecar)
+    except (OSError, ValueError):
+        return None
+    if record.get('version') != SIDECAR_VERSION or record.get('source_size') != source_size:
+        return None
+    return Loudness(*(record.get(field) for field in Loudness._fields))
+
+
+def save_measurements(path, loudness, source_size, target=None, gain=None, trim=None):
+    record = dict(loudness._asdict(), version=SIDECAR_VERSION, source_size=source_size, target=target, gain=gain,
+                  trim=list(trim) if trim is not None else None)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as sidecar:
+        json.dump(record, sidecar, indent=2)
+    os.replace(temporary_path, path)
+
+
+def measure(audio_file, output_dir='output', ffmpeg_path='ffmpeg', target=None, trim_silence=False):
+    # Returns the gain in dB and (start, end) trim in seconds to apply while
+    # encoding audio_file. Measurements are kept in a JSON file next to the
+    # outputs and reused when the same source is converted again.
+    name = os.path.splitext(os.path.basename(audio_file))[0]
+    path = sidecar_path(output_dir, name)
+    source_size = os.path.getsize(audio_file)
+    loudness = load_measurements(path, source_size)
+    if loudness is None:
+        loudness = analyze(audio_file, ffmpeg_path)
+    else:
+        print(f"{name}: reusing loudness measurements from {path}")
+
+    gain = normalization_gain(loudness, target) if target is not None else None
+    trim = trim_points(loudness) if trim_silence else None
+    try:
+        save_measurements(path, loudness, source_size, target, gain, trim)
+    except OSError as e:
+        print(f"Could not save loudness measurements for {name}: {e}")
+
+    integrated = f"{loudness.integrated:.1f} LUFS" if loudness.integrated is not None else "silent"
+    true_peak = f"{loudness.true_peak:.1f} dBTP" if loudness.true_peak is not None else "no peak"
+    print(f"{name}: {integrated}, {true_peak}" + (f", gain {gain:+.2f} dB" if gain is not None else ''))
+    return gain, trim
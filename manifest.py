@@ -0,0 +1,125 @@
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+MANIFEST_FILE = '.audiophile-manifest.sqlite3'
+HASH_CHUNK_SIZE = 1024 * 1024
+LOSSLESS_FORMATS = ('flac', 'wav')
+
+SKIPPED = 'skipped'
+MISSING = 'missing'
+ALTERED = 'altered'
+RECORDED = 'recorded'
+
+
+def file_checksum(path, chunk_size=HASH_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as output_file:
+        for chunk in iter(lambda: output_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_key(target, conversion_method, processing=''):
+    # processing describes changes to the audio itself, such as loudness
+    # normalization; plain conversions keep their original keys. Lossless
+    # outputs ignore the bitrate and sampling rate, so those are left out of
+    # their keys just as can_stream_copy leaves them out.
+    method = conversion_method if conversion_method in ('pydub', 'chunked') else 'ffmpeg'
+    if target.format in LOSSLESS_FORMATS:
+        target = target._replace(bitrate=None, sampling_rate=None)
+    key = f"{target.format}:{target.bitrate}:{target.sampling_rate}:{target.bit_depth}:{method}"
+    return f"{key}:{processing}" if processing else key
+
+
+class OutputManifest:
+    # Index of finished outputs keyed by video ID and the full encode
+    # settings. A lookup is one primary-key read plus a stat() per output, so
+    # a re-sync of an unchanged library never touches the network; files are
+    # only re-hashed when their size matches but their mtime does not.
+    def __init__(self, path):
+        self.path = path
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                "video_id TEXT NOT NULL, encode_key TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                "mtime REAL NOT NULL, sha256 TEXT NOT NULL, recorded_at REAL NOT NULL, "
+                "PRIMARY KEY (video_id, encode_key))"
+            )
+
+    def lookup(self, video_id, targets, conversion_method, processing=''):
+        # Returns the existing output paths when every target is present and
+        # unchanged, otherwise None. Stale entries are dropped so the job
+        # re-creates them.
+        keys = [encode_key(target, conversion_method, processing) for target in targets]
+        with self._lock:
+            rows = [self._connection.execute(
+                "SELECT path, size, mtime, sha256 FROM outputs WHERE video_id = ? AND encode_key = ?", (video_id, key)
+            ).fetchone() for key in keys]
+        if any(row is None for row in rows):
+            return None
+
+        paths = []
+        for key, (path, size, mtime, checksum) in zip(keys, rows):
+            state = self._verify(video_id, key, path, size, mtime, checksum)
+            if state is not None:
+                self._count(state)
+                self._forget(video_id, key)
+                return None
+            paths.append(path)
+        self._count(SKIPPED)
+        return paths
+
+    def _verify(self, video_id, key, path, size, mtime, checksum):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return MISSING
+        # Empty outputs were recorded by failed streams before those were
+        # detected, so they are never trusted.
+        if stat.st_size != size or size == 0:
+            return ALTERED
+        if stat.st_mtime != mtime:
+            if file_checksum(path) != checksum:
+                return ALTERED
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "UPDATE outputs SET mtime = ? WHERE video_id = ? AND encode_key = ?", (stat.st_mtime, video_id, key)
+                )
+        return None
+
+    def record(self, video_id, targets, conversion_method, paths, processing=''):
+        now = time.time()
+        rows = []
+        for target, path in zip(targets, paths):
+            stat = os.stat(path)
+            rows.append((video_id, encode_key(target, conversion_method, processing), os.path.abspath(path),
+                         stat.st_size, stat.st_mtime, file_checksum(path), now))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO outputs (video_id, encode_key, path, size, mtime, sha256, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        self._count(RECORDED, len(rows))
+
+    def _forget(self, video_id, key):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM outputs WHERE video_id = ? AND encode_key = ?", (video_id, key))
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
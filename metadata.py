@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_RESOLVE_WORKERS = 8
+
+_VIDEO_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_PATH_PREFIXES = ('/shorts/', '/embed/', '/live/', '/v/')
+
+
+def video_id(url):
+    parsed = urllib.parse.urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith('www.') or host.startswith('m.'):
+        host = host.split('.', 1)[1]
+
+    candidate = None
+    if host == 'youtu.be':
+        candidate = parsed.path.lstrip('/').split('/')[0]
+    elif host.endswith('youtube.com') or host.endswith('youtube-nocookie.com'):
+        query = urllib.parse.parse_qs(parsed.query)
+        if 'v' in query:
+            candidate = query['v'][0]
+        else:
+            for prefix in _PATH_PREFIXES:
+                if parsed.path.startswith(prefix):
+                    candidate = parsed.path[len(prefix):].split('/')[0]
+                    break
+
+    if candidate and _VIDEO_ID.match(candidate):
+        return candidate
+    return urllib.parse.urlunparse(parsed._replace(fragment=''))
+
+
+def default_cache_path():
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'audiophile', 'metadata.sqlite3')
+
+
+class MetadataCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "video_id TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT data, fetched_at FROM metadata WHERE video_id = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._connection.execute("DELETE FROM metadata WHERE video_id = ?", (key,))
+                return None
+            self._connection.execute("UPDATE metadata SET accessed_at = ? WHERE video_id = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, data):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO metadata (video_id, data, fetched_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(data), now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self._connection.execute("DELETE FROM metadata WHERE fetched_at < ?", (now - self.ttl,))
+        count = self._connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM metadata WHERE video_id IN "
+                "(SELECT video_id FROM metadata ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM metadata")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def cached_fetch(url, fetch, cache=None):
+    key = video_id(url)
+    if cache is not None:
+        data = cache.get(key)
+        if data is not None:
+            return data
+    data = fetch(url)
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+
+def resolve_all(urls, fetch, cache=None, max_workers=DEFAULT_RESOLVE_WORKERS):
+    # Yields (url, metadata, error) as soon as each lookup finishes; cache hits
+    # come back immediately and only misses are sent to the thread pool.
+    misses = []
+    for url in urls:
+        data = cache.get(video_id(url)) if cache is not None else None
+        if data is not None:
+            yield url, data, None
+        else:
+            misses.append(url)
+
+    if not misses:
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(cached_fetch, url, fetch, cache): url for url in misses}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                yield url, future.result(), None
+            except Exception as e:
+                yield url, None, e
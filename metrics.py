@@ -0,0 +1,114 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+METRICS_FILE = '.audiophile-metrics.jsonl'
+
+RESOLVE = 'resolve'
+WAIT = 'wait'
+DOWNLOAD = 'download'
+STREAM = 'stream'
+ANALYZE = 'analyze'
+TRANSCODE = 'transcode'
+CLEANUP = 'cleanup'
+
+
+class JobMetrics:
+    def __init__(self, url, job_id=None):
+        self.url = url
+        self.job_id = job_id
+        self.started_at = time.time()
+        self.stages = {}
+        self.bytes_downloaded = 0
+        self.media_duration = None
+        self.encode_seconds = None
+        self.outputs = []
+        self.state = None
+        self.error = None
+        self._open = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # Time spent in a stage opened inside another one, such as the wait
+        # for a host slot while streaming, only counts for the inner stage.
+        started = time.perf_counter()
+        with self._lock:
+            self._open.append(0.0)
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                nested = self._open.pop()
+                if self._open:
+                    self._open[-1] += elapsed
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_downloaded += count
+
+    @property
+    def download_mbps(self):
+        seconds = self.stages.get(DOWNLOAD) or self.stages.get(STREAM)
+        if not seconds or not self.bytes_downloaded:
+            return None
+        return self.bytes_downloaded / seconds / 1e6
+
+    @property
+    def realtime_factor(self):
+        seconds = self.encode_seconds or self.stages.get(TRANSCODE) or self.stages.get(STREAM)
+        if not seconds or not self.media_duration:
+            return None
+        return self.media_duration / seconds
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.error = str(error) if error is not None else None
+
+    def to_dict(self):
+        with self._lock:
+            stages = {name: round(seconds, 4) for name, seconds in self.stages.items()}
+        download_mbps = self.download_mbps
+        realtime_factor = self.realtime_factor
+        return {
+            'job_id': self.job_id,
+            'url': self.url,
+            'started_at': round(self.started_at, 3),
+            'state': self.state,
+            'error': self.error,
+            'stages': stages,
+            'total_seconds': round(sum(stages.values()), 4),
+            'bytes_downloaded': self.bytes_downloaded,
+            'download_mbps': round(download_mbps, 3) if download_mbps is not None else None,
+            'media_duration': self.media_duration,
+            'encode_seconds': round(self.encode_seconds, 4) if self.encode_seconds is not None else None,
+            'realtime_factor': round(realtime_factor, 2) if realtime_factor is not None else None,
+            'outputs': self.outputs,
+        }
+
+
+def stage(metrics, name):
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.stage(name)
+
+
+class MetricsWriter:
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record, path=None):
+        path = path or self.path
+        if not path:
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        line = json.dumps(record)
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as metrics_file:
+                metrics_file.write(line + '\n')
@@ -0,0 +1,102 @@
+import urllib.parse
+from collections import OrderedDict
+
+from extractors import YDL_OPTIONS, load_backend
+from metadata import video_id
+
+DEFAULT_SEEN_LIMIT = 100000
+MAX_NESTING = 3
+
+_COLLECTION_PATHS = ('/playlist', '/channel/', '/c/', '/user/', '/@')
+
+
+def is_collection_url(url):
+    parsed = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(parsed.query)
+    if 'list' in query and 'v' not in query:
+        return True
+    return parsed.path.startswith(_COLLECTION_PATHS)
+
+
+def watch_url(entry_url):
+    if len(entry_url) == 11 and video_id(f"https://youtu.be/{entry_url}") == entry_url:
+        return f"https://www.youtube.com/watch?v={entry_url}"
+    return entry_url
+
+
+def _iter_pytube(url):
+    backend = load_backend('pytube')
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    collection = backend.Playlist(url) if 'list' in query else backend.Channel(url)
+    yield from collection.url_generator()
+
+
+def _iter_ydl_entries(ydl, url, depth=0):
+    # process=False plus lazy_playlist keeps `entries` a generator that pages
+    # through the playlist on demand instead of materializing it.
+    info = ydl.extract_info(url, download=False, process=False)
+    for entry in info.get('entries') or ():
+        if not entry:
+            continue
+        entry_url = entry.get('url') or entry.get('webpage_url') or entry.get('id')
+        if entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab':
+            if depth < MAX_NESTING and entry_url:
+                yield from _iter_ydl_entries(ydl, entry_url, depth + 1)
+        elif entry_url:
+            yield watch_url(entry_url)
+
+
+def iter_collection(url, library_source='pytube', sessions=None):
+    if library_source == 'pytube':
+        yield from _iter_pytube(url)
+    elif sessions is not None:
+        with sessions.session(library_source) as ydl:
+            ydl.params['extract_flat'] = 'in_playlist'
+            ydl.params['lazy_playlist'] = True
+            yield from _iter_ydl_entries(ydl, url)
+    else:
+        options = dict(YDL_OPTIONS, extract_flat='in_playlist', lazy_playlist=True)
+        with load_backend(library_source).YoutubeDL(options) as ydl:
+            yield from _iter_ydl_entries(ydl, url)
+
+
+class SeenSet:
+    # Remembers the most recent `limit` keys, so deduplication stays constant
+    # memory even for channels with tens of thousands of uploads.
+    def __init__(self, limit=DEFAULT_SEEN_LIMIT):
+        self.limit = limit
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.limit:
+            self._keys.popitem(last=False)
+        return True
+
+
+def expand_inputs(inputs, library_source='pytube', sessions=None, seen_limit=DEFAULT_SEEN_LIMIT):
+    # Expands (key, url) pairs into (key, video url) pairs, followed by
+    # (key, None) once an input is exhausted, so callers can tell which input
+    # every video came from and when an input turned out to add nothing new.
+    seen = SeenSet(seen_limit)
+    for key, url in inputs:
+        if is_collection_url(url):
+            try:
+                entries = iter_collection(url, library_source, sessions)
+                for entry in entries:
+                    if seen.add(video_id(entry)):
+                        yield key, entry
+            except Exception as e:
+                print(f"Could not expand {url}: {e}")
+        elif seen.add(video_id(url)):
+            yield key, url
+        yield key, None
+
+
+def expand_urls(urls, library_source='pytube', sessions=None, seen_limit=DEFAULT_SEEN_LIMIT):
+    for _, url in expand_inputs(((url, url) for url in urls), library_source, sessions, seen_limit):
+        if url is not None:
+            yield url
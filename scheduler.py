@@ -0,0 +1,268 @@
+import itertools
+import os
+import queue
+import threading
+
+PENDING = 'pending'
+DOWNLOADING = 'downloading'
+DOWNLOADED = 'downloaded'
+TRANSCODING = 'transcoding'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+SKIPPED = 'skipped'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED, SKIPPED)
+
+_STOP = object()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobSkipped(Exception):
+    # Raised by a stage when the job's outputs already exist.
+    def __init__(self, outputs):
+        super().__init__(outputs)
+        self.outputs = outputs
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, url, **options):
+        self.id = next(Job._ids)
+        self.url = url
+        self.options = options
+        self.state = PENDING
+        self.source = None
+        self.output = None
+        self.error = None
+        self.metrics = None
+        self.input = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.url)
+
+
+class JobScheduler:
+    # Two-stage pipeline: network-bound download workers feed a bounded queue
+    # drained by CPU-bound transcode workers, so a full queue throttles downloads
+    # instead of piling up sources on disk.
+    def __init__(self, download_stage, transcode_stage, download_workers=4, transcode_workers=None,
+                 queue_size=None, on_state_change=None, discard_source=None):
+        self.download_stage = download_stage
+        self.transcode_stage = transcode_stage
+        self.download_workers = max(1, download_workers)
+        self.transcode_workers = max(1, transcode_workers or os.cpu_count() or 1)
+        self.on_state_change = on_state_change
+        self.discard_source = discard_source
+
+        self._pending = queue.Queue()
+        self._downloaded = queue.Queue(maxsize=queue_size or self.transcode_workers * 2)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+        self._feeds = []
+        self._threads = []
+        self._live_download_workers = 0
+        self._shutdown = False
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._live_download_workers = self.download_workers
+            for index in range(self.download_workers):
+                self._spawn(self._download_loop, f"download-{index}")
+            for index in range(self.transcode_workers):
+                self._spawn(self._transcode_loop, f"transcode-{index}")
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, job):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Scheduler has been shut down.")
+            self._jobs[job.id] = job
+        self.start()
+        self._notify(job)
+        self._pending.put(job)
+        return job
+
+    def submit_iter(self, jobs, max_pending=None):
+        # Jobs are pulled from the iterable only while the download queue has
+        # room, so a lazily expanded playlist starts downloading right away and
+        # is never materialized in full.
+        max_pending = max_pending or self.download_workers * 2
+        stop = threading.Event()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Scheduler has been shut down.")
+            self._feeds.append(stop)
+
+        def feed():
+            try:
+                for job in jobs:
+                    with self._space:
+                        self._space.wait_for(lambda: stop.is_set() or self._pending.qsize() < max_pending)
+                    if stop.is_set():
+                        break
+                    self.submit(job)
+            except Exception as e:
+                print(f"Could not queue jobs: {e}")
+            finally:
+                with self._idle:
+                    self._feeds.remove(stop)
+                    if not self._jobs and not self._feeds:
+                        self._idle.notify_all()
+
+        threading.Thread(target=feed, name="feed", daemon=True).start()
+        return stop
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            for stop in self._feeds:
+                stop.set()
+            self._space.notify_all()
+        for job in jobs:
+            job.cancel()
+
+    def active_jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def is_idle(self):
+        with self._lock:
+            return not self._jobs and not self._feeds
+
+    def join(self, timeout=None):
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._jobs and not self._feeds, timeout)
+
+    def shutdown(self, wait=True, cancel=False):
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            started = bool(self._threads)
+            for stop in self._feeds:
+                stop.set()
+            self._space.notify_all()
+        if cancel:
+            self.cancel_all()
+        if started:
+            for _ in range(self.download_workers):
+                self._pending.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _download_loop(self):
+        try:
+            while True:
+                job = self._pending.get()
+                with self._space:
+                    self._space.notify_all()
+                if job is _STOP:
+                    break
+                if job.cancelled:
+                    self._finish(job, CANCELLED)
+                    continue
+
+                self._set_state(job, DOWNLOADING)
+                try:
+                    source = self.download_stage(job)
+                except JobCancelled:
+                    self._finish(job, CANCELLED)
+                    continue
+                except JobSkipped as e:
+                    job.output = e.outputs
+                    self._finish(job, SKIPPED)
+                    continue
+                except Exception as e:
+                    self._finish(job, FAILED, e)
+                    continue
+
+                job.source = source
+                self._set_state(job, DOWNLOADED)
+                self._downloaded.put(job)
+        finally:
+            with self._lock:
+                self._live_download_workers -= 1
+                last = self._live_download_workers == 0
+            if last:
+                for _ in range(self.transcode_workers):
+                    self._downloaded.put(_STOP)
+
+    def _transcode_loop(self):
+        while True:
+            job = self._downloaded.get()
+            if job is _STOP:
+                break
+            if job.cancelled:
+                self._discard(job)
+                self._finish(job, CANCELLED)
+                continue
+
+            self._set_state(job, TRANSCODING)
+            try:
+                job.output = self.transcode_stage(job, job.source)
+            except JobCancelled:
+                self._discard(job)
+                self._finish(job, CANCELLED)
+            except Exception as e:
+                self._discard(job)
+                self._finish(job, FAILED, e)
+            else:
+                self._finish(job, DONE)
+
+    def _discard(self, job):
+        if self.discard_source is None or job.source is None:
+            return
+        try:
+            self.discard_source(job, job.source)
+        except Exception as e:
+            print(f"Could not discard source for {job.url}: {e}")
+
+    def _set_state(self, job, state):
+        job.state = state
+        self._notify(job)
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        self._notify(job)
+        with self._idle:
+            self._jobs.pop(job.id, None)
+            if not self._jobs and not self._feeds:
+                self._idle.notify_all()
+
+    def _notify(self, job):
+        if self.on_state_change is None:
+            return
+        try:
+            self.on_state_change(job)
+        except Exception as e:
+            print(f"State callback failed for {job.url}: {e}")
@@ -0,0 +1,244 @@
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+
+import gapless
+from transcoder import (ENCODE, AudioProbe, TranscodeOutput, TranscodeResult, adjust_stream, build_outputs, can_stream_copy,
+                        ffprobe_path_for, normalize_codec, output_options, output_paths)
+
+SEGMENT_THRESHOLD = 20 * 60
+MIN_SEGMENT_SECONDS = 60
+SEEK_MARGIN = 10
+
+# Codec frame size and encoder delay in samples, the elementary container
+# segments are written to as ffmpeg names its muxer and its demuxer (they
+# differ for ADTS), and extra encoder and muxer options. Bit reservoir use is
+# disabled for MP3 so no kept frame borrows bits from a frame that is cut,
+# and segments carry no tags; the joined file gets its own, see _concat.
+SEGMENT_FORMATS = {
+    'mp3': (1152, 1105, 'mp3', 'mp3', {'reservoir': 0}, {'write_xing': 0, 'id3v2_version': 0}),
+    'aac': (1024, 1024, 'adts', 'aac', {}, {}),
+}
+
+_SAMPLE_COUNT = re.compile(r'Number of samples: (\d+)')
+
+# Segments start and end this many frames beyond the part that is kept, so
+# the frames on either side of a seam are encoded with real audio around them
+# and the decoder's overlap-add lines up across it.
+ROLL_FRAMES = 2
+
+# Shared by every segmented job in the process, so several long tracks at
+# once still keep only one encoder per core busy.
+_slots = threading.BoundedSemaphore(os.cpu_count() or 1)
+
+
+def probe_duration(source, ffmpeg_path='ffmpeg'):
+    info = ffmpeg.probe(source, cmd=ffprobe_path_for(ffmpeg_path))
+    stream = next((s for s in info.get('streams', []) if s.get('codec_type') == 'audio'), None)
+    if stream is None:
+        return None, None
+    duration = stream.get('duration') or info.get('format', {}).get('duration')
+    sample_rate = stream.get('sample_rate')
+    bitrate = stream.get('bit_rate') or info.get('format', {}).get('bit_rate')
+    probe = AudioProbe(
+        normalize_codec(stream.get('codec_name')),
+        int(sample_rate) if sample_rate else None,
+        int(bitrate) if bitrate else None,
+        stream.get('channels')
+    )
+    return float(duration) if duration else None, probe
+
+
+def plan_segments(total_samples, sample_rate, format, max_segments):
+    # Returns (start, end, preroll, postroll) in output samples, with end None
+    # for the last segment. Every seam is placed so that seam + encoder delay
+    # is a whole number of frames, i.e. it falls exactly between two packets
+    # and segments can be joined by copying packets.
+    frame_size, delay = SEGMENT_FORMATS[format][:2]
+    count = max(1, min(max_segments, total_samples // (MIN_SEGMENT_SECONDS * sample_rate)))
+    length = math.ceil(total_samples / count / frame_size) * frame_size
+    postroll = ROLL_FRAMES * frame_size
+    preroll = postroll + (-delay) % frame_size
+
+    seams = []
+    for index in range(1, count):
+        seam = index * length - delay % frame_size
+        if seam - (seams[-1] if seams else 0) < frame_size or seam >= total_samples:
+            break
+        seams.append(seam)
+
+    starts = [0] + seams
+    ends = seams + [None]
+    return [(start, end, preroll if start else 0, postroll if end is not None else 0) for start, end in zip(starts, ends)]
+
+
+def _encode_segment(source, path, target, sample_rate, segment, ffmpeg_path, gain=None):
+    # Returns the path and the number of source samples the segment keeps.
+    # The last segment runs to the end of the source, so its samples are
+    # counted while it is encoded.
+    start, end, preroll, postroll = segment
+    frame_size, delay, muxer, demuxer, extra, mux_options = SEGMENT_FORMATS[target.format]
+    first = start - preroll
+    # The input seek lands on a whole second, which is a whole number of
+    # samples at any rate, and ffmpeg's accurate seek discards everything
+    # decoded before it. atrim counts samples from where decoding starts, so
+    # the trim points are taken relative to the seek.
+    seek = max(0, first // sample_rate - SEEK_MARGIN)
+    offset = seek * sample_rate
+    trim = {'start_sample': first - offset}
+    if end is not None:
+        trim['end_sample'] = end + postroll - offset
+    options = dict(output_options(target.format, target.bitrate, sample_rate)[1], **extra)
+
+    stream = (
+        ffmpeg
+        .input(source, **({'ss': seek} if seek else {}))
+        .audio
+        .filter('aresample', sample_rate)
+        .filter('atrim', **trim)
+        .filter('asetpts', 'PTS-STARTPTS')
+    )
+    if end is None:
+        stream = stream.filter('astats', measure_perchannel='none', measure_overall='Number_of_samples')
+    if gain:
+        stream = stream.filter('volume', f"{gain}dB")
+    encoded = path + '.encoded'
+    with _slots:
+        _, log = (
+            stream
+            .output(encoded, f=muxer, **options, **mux_options)
+            .global_args('-loglevel', 'error' if end is not None else 'info', '-nostats')
+            .overwrite_output()
+            .run(cmd=ffmpeg_path, capture_stderr=True)
+        )
+    if end is not None:
+        kept = end - start
+    else:
+        counted = _SAMPLE_COUNT.search(log.decode(errors='replace'))
+        if counted is None:
+            raise RuntimeError(f"ffmpeg did not report how many samples the last segment of {source} holds")
+        kept = int(counted.group(1)) - preroll
+
+    # Output sample s of the segment is heard at (s + delay) / rate. Cutting
+    # half a frame before each seam keeps exactly the packets that carry
+    # [start, end), whatever the rounding of their timestamps.
+    cut = {'ss': (preroll + delay - frame_size / 2) / sample_rate} if preroll else {}
+    if end is not None:
+        cut['to'] = (preroll + delay + end - start - frame_size / 2) / sample_rate
+    (
+        ffmpeg
+        .input(encoded, f=demuxer)
+        .output(path, f=muxer, c='copy', **cut, **mux_options)
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+        .run(cmd=ffmpeg_path)
+    )
+    os.remove(encoded)
+    return path, kept
+
+
+def _concat(segments, output_path, work_dir, ffmpeg_path, format, sample_rate):
+    # Joins the segments packet for packet, then restores what a single-pass
+    # encode records about its encoder delay and padding: a LAME tag for MP3,
+    # an edit list for M4A. Without them players would start delay samples
+    # late and play the padding of the last frame.
+    delay, muxer, mux_options = SEGMENT_FORMATS[format][1], SEGMENT_FORMATS[format][2], SEGMENT_FORMATS[format][5]
+    total_samples = sum(kept for _, kept in segments)
+    listing = os.path.join(work_dir, os.path.basename(output_path) + '.txt')
+    with open(listing, 'w', encoding='utf-8') as listing_file:
+        for path, _ in segments:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            listing_file.write(f"file '{escaped}'\n")
+    if format == 'mp3':
+        joined = os.path.join(work_dir, os.path.basename(output_path) + '.joined')
+        (
+            ffmpeg
+            .input(listing, f='concat', safe=0)
+            .output(joined, f=muxer, c='copy', **mux_options)
+            .global_args('-loglevel', 'error')
+            .overwrite_output()
+            .run(cmd=ffmpeg_path)
+        )
+        gapless.write_mp3(joined, output_path, delay, total_samples)
+        os.remove(joined)
+    else:
+        # Starting the packets delay samples early makes the muxer write an
+        # edit list, which set_mp4_edit then makes sample exact.
+        (
+            ffmpeg
+            .input(listing, f='concat', safe=0, itsoffset=-delay / sample_rate)
+            .output(output_path, c='copy', movie_timescale=sample_rate)
+            .global_args('-loglevel', 'error')
+            .overwrite_output()
+            .run(cmd=ffmpeg_path)
+        )
+        gapless.set_mp4_edit(output_path, delay, total_samples)
+
+
+def segmented_transcode(audio_file, output_dir='output', targets=(), ffmpeg_path='ffmpeg', threshold=SEGMENT_THRESHOLD,
+                        max_workers=None, stream_copy=True, remove_source=True, gain=None):
+    # Splits long tracks into time segments that are encoded in parallel and
+    # joined packet for packet. Returns None when the track is shorter than
+    # threshold or no target is lossy and needs encoding, so the caller takes
+    # the normal single-process path. gain, in dB, is applied to every
+    # segment alike.
+    started = time.perf_counter()
+    duration, probe = probe_duration(audio_file, ffmpeg_path)
+    if duration is None or duration < threshold:
+        return None
+
+    targets = list(targets)
+    copy_probe = probe if stream_copy and not gain else None
+    segmented = [index for index, target in enumerate(targets)
+                 if target.format in SEGMENT_FORMATS
+                 and not can_stream_copy(copy_probe, target.format, target.bitrate, target.sampling_rate)]
+    if not segmented:
+        return None
+
+    name = os.path.splitext(os.path.basename(audio_file))[0]
+    paths = output_paths(output_dir, name, targets)
+    max_workers = max_workers or os.cpu_count() or 1
+    work_dir = tempfile.mkdtemp(prefix='.segments-', dir=output_dir)
+    outputs = [None] * len(targets)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = []
+            for index in segmented:
+                target = targets[index]
+                sample_rate = int(target.sampling_rate or probe.sample_rate or 48000)
+                extension = SEGMENT_FORMATS[target.format][2]
+                segments = plan_segments(int(duration * sample_rate), sample_rate, target.format, max_workers)
+                futures = [executor.submit(_encode_segment, audio_file, os.path.join(work_dir, f"{index}-{number:04d}.{extension}"),
+                                           target, sample_rate, segment, ffmpeg_path, gain)
+                           for number, segment in enumerate(segments)]
+                pending.append((index, sample_rate, futures))
+
+            rest = [index for index in range(len(targets)) if index not in segmented]
+            if rest:
+                graph, others = build_outputs(adjust_stream(ffmpeg.input(audio_file), gain), output_dir, name, [targets[index] for index in rest],
+                                              copy_probe, [paths[index] for index in rest])
+                graph.run(cmd=ffmpeg_path)
+                for index, output in zip(rest, others):
+                    outputs[index] = output
+
+            for index, sample_rate, futures in pending:
+                _concat([future.result() for future in futures], paths[index], work_dir, ffmpeg_path, targets[index].format, sample_rate)
+                outputs[index] = TranscodeOutput(paths[index], targets[index].format, ENCODE)
+    except BaseException:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if remove_source:
+        os.remove(audio_file)
+    return TranscodeResult(outputs, time.perf_counter() - started)
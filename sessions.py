@@ -0,0 +1,104 @@
+import contextlib
+import copy
+import threading
+import urllib.request
+
+from extractors import YDL_OPTIONS, load_backend
+
+
+def _share_cookiejar(ydl, cookiejar):
+    # The shared jar is the first instance's own, since both backends expect
+    # their YoutubeDLCookieJar subclass. youtube_dl builds a urllib opener
+    # around its jar in __init__, while yt_dlp creates its request handlers
+    # lazily from the cached `cookiejar` property, so each needs the shared
+    # jar swapped in differently.
+    opener = getattr(ydl, '_opener', None)
+    if opener is not None:
+        for handler in opener.handlers:
+            if isinstance(handler, urllib.request.HTTPCookieProcessor):
+                handler.cookiejar = cookiejar
+        ydl.cookiejar = cookiejar
+    else:
+        ydl.__dict__['cookiejar'] = cookiejar
+
+
+def _snapshot(params):
+    return {key: copy.copy(value) for key, value in params.items()}
+
+
+class ExtractorSessionPool:
+    # Hands out long-lived YoutubeDL instances so a batch pays for extractor
+    # initialization and connection setup once per worker instead of once per
+    # URL. An instance is only ever used by the thread that checked it out, and
+    # its params are restored on check-in so one job cannot leak options into
+    # the next.
+    def __init__(self, options=None, max_sessions=None):
+        self.options = dict(YDL_OPTIONS, **(options or {}))
+        self.max_sessions = max_sessions
+        self._idle = {}
+        self._created = {}
+        self._cookiejars = {}
+        self._lock = threading.Condition()
+        self._closed = False
+
+    @contextlib.contextmanager
+    def session(self, library_source):
+        ydl = self._acquire(library_source)
+        try:
+            yield ydl
+        finally:
+            self._release(library_source, ydl)
+
+    def _acquire(self, library_source):
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Extractor session pool is closed.")
+                idle = self._idle.setdefault(library_source, [])
+                if idle:
+                    return idle.pop()
+                created = self._created.get(library_source, 0)
+                if self.max_sessions is None or created < self.max_sessions:
+                    self._created[library_source] = created + 1
+                    break
+                self._lock.wait()
+
+        try:
+            backend = load_backend(library_source)
+            ydl = backend.YoutubeDL(copy.deepcopy(self.options))
+            with self._lock:
+                cookiejar = self._cookiejars.setdefault(library_source, ydl.cookiejar)
+            if cookiejar is not ydl.cookiejar:
+                _share_cookiejar(ydl, cookiejar)
+            ydl._audiophile_params = _snapshot(ydl.params)
+            return ydl
+        except BaseException:
+            with self._lock:
+                self._created[library_source] -= 1
+                self._lock.notify()
+            raise
+
+    def _release(self, library_source, ydl):
+        ydl.params.clear()
+        ydl.params.update(_snapshot(ydl._audiophile_params))
+        with self._lock:
+            if self._closed:
+                self._close_session(ydl)
+                return
+            self._idle.setdefault(library_source, []).append(ydl)
+            self._lock.notify()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            sessions = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+            self._lock.notify_all()
+        for ydl in sessions:
+            self._close_session(ydl)
+
+    def _close_session(self, ydl):
+        try:
+            ydl.__exit__(None, None, None)
+        except Exception as e:
+            print(f"Could not close extractor session: {e}")
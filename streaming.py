@@ -0,0 +1,119 @@
+import itertools
+import os
+import struct
+import threading
+import time
+
+import ffmpeg
+
+from downloader import CHUNK_SIZE, iter_chunks
+from transcoder import AUDIO_FORMATS, OutputTarget, TranscodeResult, build_outputs, ffprobe_path_for, probe_audio
+
+
+class NotStreamable(Exception):
+    pass
+
+
+def mp4_layout(data):
+    # Walks the top-level MP4 boxes in data and returns whichever of moov,
+    # moof or mdat comes first, or None if data ends before any of them.
+    offset = 0
+    while offset + 8 <= len(data):
+        size, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        if kind in (b'moov', b'moof', b'mdat'):
+            return kind.decode()
+        if size == 1 and offset + 16 <= len(data):
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+        if size < 8:
+            return None
+        offset += size
+    return None
+
+
+def probe_source(source, ffmpeg_path='ffmpeg'):
+    probe = source.probe
+    if probe is not None and None not in probe:
+        return probe
+    try:
+        return probe_audio(source.url, ffmpeg_path, source.headers)
+    except Exception as e:
+        print(f"Could not probe {source.name}, re-encoding: {e}")
+        return probe
+
+
+def stream_transcode(source, output_dir='output', format='aac', bitrate='320k', sampling_rate=48000, bit_depth='24-bit',
+                     ffmpeg_path='ffmpeg', chunk_size=CHUNK_SIZE, job=None, stream_copy=True, targets=None, metrics=None, bandwidth=None):
+    # The source is fed to ffmpeg's stdin chunk by chunk, so nothing but the
+    # encoded outputs touch the disk and memory is bounded by chunk_size plus
+    # the pipe buffer. An MP4 whose index (moov) follows its media data cannot
+    # be decoded from a pipe, so NotStreamable is raised for it before
+    # ffmpeg starts and the caller downloads the file instead.
+    started = time.perf_counter()
+    targets = list(targets or [OutputTarget(format, bitrate, sampling_rate, bit_depth)])
+    for target in targets:
+        if target.format not in AUDIO_FORMATS:
+            raise ValueError(f"Invalid audio format selected: {target.format}")
+
+    probe = probe_source(source, ffmpeg_path) if stream_copy else None
+    chunks = iter_chunks(source.url, source.headers, chunk_size, job, metrics, bandwidth)
+    try:
+        first = next(chunks, b'')
+        if first[4:8] == b'ftyp' and mp4_layout(first) == 'mdat':
+            raise NotStreamable(f"{source.name} is an MP4 with its index at the end")
+    except BaseException:
+        chunks.close()
+        raise
+
+    graph, outputs = build_outputs(ffmpeg.input('pipe:0'), output_dir, source.name, targets, probe)
+    process = graph.run_async(cmd=ffmpeg_path, pipe_stdin=True, pipe_stderr=True)
+    errors = []
+    stderr_reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+
+    try:
+        for chunk in itertools.chain((first,), chunks):
+            process.stdin.write(chunk)
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    except BaseException:
+        process.kill()
+        process.wait()
+        stderr_reader.join()
+        _remove_outputs(outputs)
+        raise
+    finally:
+        chunks.close()
+
+    # ffmpeg can exit cleanly after failing to make sense of its input, so
+    # anything it logged at error level, or an output without audio, fails
+    # the job too.
+    returncode = process.wait()
+    stderr_reader.join()
+    message = b''.join(errors).decode(errors='replace').strip()
+    if returncode != 0 or message:
+        _remove_outputs(outputs)
+        raise RuntimeError(f"ffmpeg exited with status {returncode} for {source.url}: {message}")
+    empty = [output.path for output in outputs if not _has_audio(output.path, ffmpeg_path)]
+    if empty:
+        _remove_outputs(outputs)
+        raise RuntimeError(f"ffmpeg produced no audio for {source.url}: {', '.join(empty)}")
+
+    return TranscodeResult(outputs, time.perf_counter() - started)
+
+
+def _has_audio(path, ffmpeg_path='ffmpeg'):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    try:
+        info = ffmpeg.probe(path, cmd=ffprobe_path_for(ffmpeg_path))
+    except ffmpeg.Error:
+        return False
+    duration = info.get('format', {}).get('duration')
+    return duration is not None and float(duration) > 0
+
+
+def _remove_outputs(outputs):
+    for output in outputs:
+        if os.path.exists(output.path):
+            os.remove(output.path)
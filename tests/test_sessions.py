@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sessions import ExtractorSessionPool
+
+try:
+    import yt_dlp
+except ImportError:
+    yt_dlp = None
+
+INFO = {'id': 'pooled', 'title': 'Pooled', 'url': 'https://example.com/pooled.m4a', 'ext': 'm4a', 'extractor': 'generic',
+        'webpage_url': 'https://example.com/pooled'}
+
+
+@unittest.skipIf(yt_dlp is None, "yt_dlp is not installed")
+class PooledYtDlpSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ExtractorSessionPool()
+        self.addCleanup(self.pool.close)
+
+    def test_sessions_share_the_first_instances_cookiejar(self):
+        with self.pool.session('yt_dlp') as first, self.pool.session('yt_dlp') as second:
+            self.assertIsNot(first, second)
+            self.assertIsInstance(first.cookiejar, yt_dlp.cookies.YoutubeDLCookieJar)
+            self.assertIs(second.cookiejar, first.cookiejar)
+
+    def test_pooled_sessions_process_results(self):
+        for _ in range(2):
+            with self.pool.session('yt_dlp') as first, self.pool.session('yt_dlp') as second:
+                for ydl in (first, second):
+                    info = ydl.process_ie_result(dict(INFO), download=False)
+                    self.assertEqual(info['url'], INFO['url'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,342 @@
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import ffmpeg
+
+AUDIO_FORMATS = {
+    'aac': ('.m4a', 'aac'),
+    'mp3': ('.mp3', 'libmp3lame'),
+    'flac': ('.flac', 'flac'),
+    'wav': ('.wav', 'pcm_s16le'),
+    'opus': ('.opus', 'libopus'),
+}
+
+COPY_CODECS = {
+    'aac': 'aac',
+    'mp3': 'mp3',
+    'flac': 'flac',
+    'wav': 'pcm_s16le',
+    'opus': 'opus',
+}
+
+COPY = 'copy'
+ENCODE = 'encode'
+
+# Methods that decode the source to PCM in Python and feed encoders from it,
+# instead of running one ffmpeg graph; they skip streaming and segmenting.
+PCM_METHODS = ('pydub', 'chunked')
+
+# Frames per PCM chunk on the chunked path.
+CHUNK_FRAMES = 64 * 1024
+
+PYDUB_EXPORTS = {
+    'aac': ('m4a', 'aac'),
+    'mp3': ('mp3', 'libmp3lame'),
+    'flac': ('flac', None),
+    'wav': ('wav', None),
+    'opus': ('opus', 'libopus'),
+}
+
+OutputTarget = namedtuple('OutputTarget', ['format', 'bitrate', 'sampling_rate', 'bit_depth'], defaults=['320k', 48000, '24-bit'])
+TranscodeOutput = namedtuple('TranscodeOutput', ['path', 'format', 'mode'])
+TranscodeResult = namedtuple('TranscodeResult', ['outputs', 'elapsed', 'messages'], defaults=[()])
+AudioProbe = namedtuple('AudioProbe', ['codec', 'sample_rate', 'bitrate', 'channels'], defaults=[None])
+
+
+def ffprobe_path_for(ffmpeg_path):
+    directory, name = os.path.split(ffmpeg_path)
+    return os.path.join(directory, name.replace('ffmpeg', 'ffprobe').replace('FFMPEG', 'FFPROBE'))
+
+
+def normalize_codec(codec):
+    if codec and codec.startswith('mp4a'):
+        return 'aac'
+    return codec
+
+
+def parse_bitrate(bitrate):
+    if bitrate is None:
+        return None
+    bitrate = str(bitrate).strip().lower()
+    if bitrate.endswith('k'):
+        return int(float(bitrate[:-1]) * 1000)
+    return int(float(bitrate))
+
+
+def probe_audio(source, ffmpeg_path='ffmpeg', headers=None):
+    kwargs = {}
+    if headers:
+        kwargs['headers'] = ''.join(f"{key}: {value}\r\n" for key, value in headers.items())
+    info = ffmpeg.probe(source, cmd=ffprobe_path_for(ffmpeg_path), **kwargs)
+    stream = next((s for s in info.get('streams', []) if s.get('codec_type') == 'audio'), None)
+    if stream is None:
+        return None
+    sample_rate = stream.get('sample_rate')
+    bitrate = stream.get('bit_rate') or info.get('format', {}).get('bit_rate')
+    return AudioProbe(
+        normalize_codec(stream.get('codec_name')),
+        int(sample_rate) if sample_rate else None,
+        int(bitrate) if bitrate else None,
+        stream.get('channels')
+    )
+
+
+def can_stream_copy(probe, format='aac', bitrate='320k', sampling_rate=48000):
+    # The requested bitrate is treated as a ceiling: a source already at or
+    # below it gains nothing from a re-encode.
+    if probe is None or probe.codec != COPY_CODECS.get(format):
+        return False
+    if format in ('flac', 'wav'):
+        return True
+    if sampling_rate is not None and probe.sample_rate != int(sampling_rate):
+        return False
+    if bitrate is not None and probe.bitrate is not None and probe.bitrate > parse_bitrate(bitrate) * 1.05:
+        return False
+    return True
+
+
+def copy_options():
+    return {'codec:a': 'copy', 'vn': None}
+
+
+def output_options(format='aac', bitrate='320k', sampling_rate=48000):
+    if format not in AUDIO_FORMATS:
+        raise ValueError(f"Invalid audio format selected: {format}")
+
+    extension, codec = AUDIO_FORMATS[format]
+    options = {'codec:a': codec}
+    if format not in ('flac', 'wav') and bitrate is not None and sampling_rate is not None:
+        options['b:a'] = bitrate
+        options['ar'] = sampling_rate
+    return extension, options
+
+
+def parse_targets(spec):
+    targets = []
+    for item in spec.replace(';', ',').split(','):
+        fields = [field.strip() for field in item.split(':')]
+        if not fields[0]:
+            continue
+        if fields[0] not in AUDIO_FORMATS:
+            raise ValueError(f"Invalid audio format selected: {fields[0]}")
+        target = OutputTarget(fields[0])
+        if len(fields) > 1 and fields[1]:
+            target = target._replace(bitrate=fields[1])
+        if len(fields) > 2 and fields[2]:
+            target = target._replace(sampling_rate=int(fields[2]))
+        if len(fields) > 3 and fields[3]:
+            target = target._replace(bit_depth=fields[3])
+        targets.append(target)
+    return targets
+
+
+def output_paths(output_dir, name, targets):
+    # Targets sharing a container get their encode settings appended so
+    # that, say, a 320k and a 128k MP3 of the same track do not overwrite
+    # each other.
+    paths = []
+    for target in targets:
+        extension = AUDIO_FORMATS[target.format][0]
+        suffix = ''
+        if sum(1 for other in targets if other.format == target.format) > 1:
+            suffix = f" [{target.bitrate} {target.sampling_rate}]"
+        paths.append(os.path.join(output_dir, name + suffix + extension))
+    return paths
+
+
+def build_outputs(input_stream, output_dir, name, targets, probe=None, paths=None):
+    # An input can feed any number of outputs, but a filtered stream has a
+    # single outgoing edge, so it is split into one branch per target.
+    streams = [input_stream] * len(targets)
+    if len(targets) > 1 and isinstance(input_stream.node, ffmpeg.nodes.FilterNode):
+        split = input_stream.filter_multi_output('asplit', len(targets))
+        streams = [split[index] for index in range(len(targets))]
+    nodes = []
+    outputs = []
+    for stream, target, path in zip(streams, targets, paths or output_paths(output_dir, name, targets)):
+        if can_stream_copy(probe, target.format, target.bitrate, target.sampling_rate):
+            options = copy_options()
+            mode = COPY
+        else:
+            options = output_options(target.format, target.bitrate, target.sampling_rate)[1]
+            mode = ENCODE
+        nodes.append(stream.output(path, **options))
+        outputs.append(TranscodeOutput(path, target.format, mode))
+    return ffmpeg.merge_outputs(*nodes).global_args('-loglevel', 'error').overwrite_output(), outputs
+
+
+def adjust_stream(input_stream, gain=None, trim=None):
+    # Applies a (start, end) trim in seconds and a gain in dB to the audio of
+    # an input node; an unadjusted input is returned as is.
+    if not gain and trim is None:
+        return input_stream
+    stream = input_stream.audio
+    if trim is not None:
+        stream = stream.filter('atrim', start=trim[0], end=trim[1]).filter('asetpts', 'PTS-STARTPTS')
+    if gain:
+        stream = stream.filter('volume', f"{gain}dB")
+    return stream
+
+
+def _export_pydub(audio, path, target):
+    export_format, codec = PYDUB_EXPORTS[target.format]
+    kwargs = {'format': export_format}
+    if codec is not None:
+        kwargs['codec'] = codec
+    if target.format not in ('flac', 'wav') and target.bitrate is not None and target.sampling_rate is not None:
+        kwargs['bitrate'] = target.bitrate
+        kwargs['parameters'] = ['-ar', str(target.sampling_rate)]
+    audio.export(path, **kwargs)
+
+
+def transcode_audio(audio_file, output_dir='output', format='aac', bitrate='320k', sampling_rate=48000, bit_depth='24-bit',
+                    conversion_method='ffmpeg', ffmpeg_path='ffmpeg', stream_copy=True, targets=None, remove_source=True,
+                    chunk_frames=CHUNK_FRAMES, gain=None, trim=None):
+    # Every target is produced from a single decode of the source: ffmpeg gets
+    # one input feeding one output per target, the chunked method decodes
+    # once into fixed-size PCM chunks shared by one encoder per target, and
+    # the pydub method decodes the whole track and exports it repeatedly.
+    # A gain or trim is applied to that decode, which rules out stream copies.
+    targets = list(targets or [OutputTarget(format, bitrate, sampling_rate, bit_depth)])
+    for target in targets:
+        if target.format not in AUDIO_FORMATS:
+            raise ValueError(f"Invalid audio format selected: {target.format}")
+    name = os.path.splitext(os.path.basename(audio_file))[0]
+
+    probe = None
+    if stream_copy and not gain and trim is None:
+        try:
+            probe = probe_audio(audio_file, ffmpeg_path)
+        except Exception as e:
+            print(f"Could not probe {audio_file}, re-encoding: {e}")
+
+    if conversion_method in PCM_METHODS:
+        # Paths come from the full target list so copied and encoded outputs
+        # of the same format still get distinct names, and outputs are
+        # returned in target order.
+        paths = output_paths(output_dir, name, targets)
+        copied = [index for index, target in enumerate(targets) if can_stream_copy(probe, target.format, target.bitrate, target.sampling_rate)]
+        outputs = [None] * len(targets)
+        if copied:
+            graph, copies = build_outputs(ffmpeg.input(audio_file), output_dir, name, [targets[index] for index in copied], probe,
+                                          [paths[index] for index in copied])
+            graph.run(cmd=ffmpeg_path)
+            for index, output in zip(copied, copies):
+                outputs[index] = output
+        encoded = [index for index in range(len(targets)) if index not in copied]
+        if encoded and conversion_method == 'chunked':
+            from chunked import chunked_transcode
+            encodes = chunked_transcode(audio_file, [targets[index] for index in encoded], [paths[index] for index in encoded],
+                                        ffmpeg_path, probe.sample_rate if probe is not None else None, chunk_frames,
+                                        probe.channels if probe is not None else None, gain=gain, trim=trim)
+            for index, output in zip(encoded, encodes):
+                outputs[index] = output
+        elif encoded:
+            from pydub import AudioSegment
+            audio = AudioSegment.from_file(audio_file)
+            if trim is not None:
+                audio = audio[int(trim[0] * 1000):int(trim[1] * 1000)]
+            if gain:
+                audio = audio.apply_gain(gain)
+            for index in encoded:
+                _export_pydub(audio, paths[index], targets[index])
+                outputs[index] = TranscodeOutput(paths[index], targets[index].format, ENCODE)
+    else:
+        graph, outputs = build_outputs(adjust_stream(ffmpeg.input(audio_file), gain, trim), output_dir, name, targets, probe)
+        graph.run(cmd=ffmpeg_path)
+
+    if remove_source:
+        os.remove(audio_file)
+    return outputs
+
+
+def _init_worker():
+    # A worker's fd 1 is the parent's, which the CLI reserves for NDJSON
+    # events; anything printed outside a transcode goes to stderr instead.
+    sys.stdout = sys.stderr
+
+
+def _run_transcode(audio_file, options):
+    # Messages printed during the transcode are returned with the result so
+    # the parent prints them where its own output goes, e.g. the GUI console.
+    started = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            outputs = transcode_audio(audio_file, **options)
+    except ffmpeg.Error as e:
+        # ffmpeg.Error cannot be unpickled in the parent, where it would break
+        # the whole pool, so it crosses as a RuntimeError with its message.
+        sys.stdout.write(log.getvalue())
+        message = (e.stderr or b'').decode(errors='replace').strip()
+        raise RuntimeError(f"ffmpeg failed while converting {audio_file}: {message or e}") from None
+    except BaseException:
+        sys.stdout.write(log.getvalue())
+        raise
+    return TranscodeResult(outputs, time.perf_counter() - started, tuple(log.getvalue().splitlines()))
+
+
+class TranscodeEngine:
+    # Encodes run in worker processes so pydub's in-interpreter decoding and
+    # export do not serialize on the GIL. Workers are spawned rather than forked
+    # so they never inherit the GUI's threads or Qt state.
+    def __init__(self, max_workers=None, ffmpeg_path='ffmpeg'):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.ffmpeg_path = ffmpeg_path
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+            return self._executor
+
+    def resize(self, max_workers):
+        # Encodes already submitted finish on the old pool; later ones go to a
+        # pool of the new size.
+        max_workers = max_workers or os.cpu_count() or 1
+        with self._lock:
+            if max_workers == self.max_workers:
+                return
+            self.max_workers = max_workers
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def submit(self, audio_file, output_dir='output', format='aac', bitrate='320k', sampling_rate=48000, bit_depth='24-bit',
+               conversion_method='ffmpeg', stream_copy=True, targets=None, remove_source=True, chunk_frames=CHUNK_FRAMES,
+               gain=None, trim=None):
+        options = {
+            'output_dir': output_dir,
+            'format': format,
+            'bitrate': bitrate,
+            'sampling_rate': sampling_rate,
+            'bit_depth': bit_depth,
+            'conversion_method': conversion_method,
+            'ffmpeg_path': self.ffmpeg_path,
+            'stream_copy': stream_copy,
+            'targets': targets,
+            'remove_source': remove_source,
+            'chunk_frames': chunk_frames,
+            'gain': gain,
+            'trim': trim,
+        }
+        return self._get_executor().submit(_run_transcode, audio_file, options)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)